@@ -0,0 +1,130 @@
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+import scipy.sparse
+
+# Set the current and root directories to find required files/modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, ".."))
+sys.path.append(root_directory)
+
+from src.components.BilinearModel_Neurodynamics_v1 import (
+    Neurodynamics,
+    Neurodynamics_CompiledModel,
+)
+from src.components.BilinearModel_StimulusGenerator import (
+    bilinear_model_stimulus_train_generator,
+)
+
+
+def random_connectivity(nRegions, connections_per_region=4, nInputs=2, seed=0):
+    """
+    Random sparse A, B and C with a fixed number of connections per region.
+    """
+    rng = np.random.default_rng(seed)
+    nnz = nRegions * connections_per_region
+    rows = rng.integers(0, nRegions, nnz)
+    cols = rng.integers(0, nRegions, nnz)
+
+    A = scipy.sparse.coo_matrix(
+        (rng.uniform(-0.05, 0.0, nnz), (rows, cols)), shape=(nRegions, nRegions)
+    ).tocsr()
+    A.setdiag(-0.3)
+    B = [
+        scipy.sparse.random(
+            nRegions, nRegions, density=connections_per_region / nRegions,
+            random_state=seed + i, format="csr",
+        )
+        * -0.1
+        for i in range(nInputs)
+    ]
+    C = scipy.sparse.random(
+        nRegions, nInputs, density=0.2, random_state=seed, format="csr"
+    ) * 0.08
+    return A, B, C
+
+
+def local_connectivity(nRegions, neighbours=2, nInputs=2, seed=0):
+    """
+    Sparse A, B and C where every region only connects to its nearest neighbours.
+    """
+    offsets = [k for k in range(-neighbours, neighbours + 1) if k != 0]
+    A = scipy.sparse.diags(
+        [-0.3] + [-0.05] * len(offsets), [0] + offsets, shape=(nRegions, nRegions),
+        format="csr",
+    )
+    B = [
+        scipy.sparse.diags([-0.1], [1 - 2 * i], shape=(nRegions, nRegions), format="csr")
+        for i in range(nInputs)
+    ]
+    C = scipy.sparse.random(
+        nRegions, nInputs, density=0.2, random_state=seed, format="csr"
+    ) * 0.08
+    return A, B, C
+
+
+def matrix_bytes(A, B, C):
+    """Memory held by the connectivity matrices."""
+    total = 0
+    for M in [A, C, *B]:
+        if scipy.sparse.issparse(M):
+            total += M.data.nbytes + M.indices.nbytes + M.indptr.nbytes
+        else:
+            total += M.nbytes
+    return total
+
+
+def time_call(function, repeats):
+    """Mean runtime of function() in seconds."""
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    freq = 10.84
+    U, timestamps = bilinear_model_stimulus_train_generator(
+        freq, [5, 5], [25, 25], [2, 2], 2
+    )
+
+    # Sparse matrices always save memory and right-hand side time. The BDF run
+    # is only faster for graphs whose LU factors stay sparse, like local
+    # coupling; random graphs fill them in and fall back to a dense Jacobian.
+    print(
+        f"{'graph':>6} {'regions':>8} {'backend':>7} {'MB':>8} {'RHS (us)':>10}"
+        f" {'BDF run (s)':>12}"
+    )
+    for (graph, connectivity), nRegions in itertools.product(
+        [("random", random_connectivity), ("local", local_connectivity)],
+        [50, 200, 400, 2000],
+    ):
+        A, B, C = connectivity(nRegions)
+        dense = (
+            A.toarray(),
+            np.stack([B_i.toarray() for B_i in B], axis=2),
+            C.toarray(),
+        )
+        Z = np.random.default_rng(1).standard_normal(nRegions)
+        Z0 = np.zeros(nRegions)
+
+        for backend, (A_b, B_b, C_b) in [("dense", dense), ("sparse", (A, B, C))]:
+            model = Neurodynamics_CompiledModel(A_b, B_b, C_b, U, freq, cache_size=0)
+            rhs_time = time_call(lambda: model(Z, 7.0), 200)
+            run_time = time_call(
+                lambda: Neurodynamics(
+                    Z0, timestamps, A_b, B_b, C_b, U, method="BDF", freq=freq
+                ),
+                1,
+            )
+            print(
+                f"{graph:>6} {nRegions:>8} {backend:>7} {matrix_bytes(A_b, B_b, C_b) / 1e6:>8.3f}"
+                f" {rhs_time * 1e6:>10.1f} {run_time:>12.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import hashlib
+import os
+import sys
+from collections import OrderedDict
+
+import numpy as np
+from scipy.signal import fftconvolve
+
+# Define paths to easily import custom modules.
+# The repository root is the parent of the Bilinear_model_fNIRS project folder.
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, "..", "..", ".."))
+# Adding the root directory to the system path
+sys.path.append(root_directory)
+
+from Bilinear_model_fNIRS.src.components.BilinearModel_Hemodynamics import Hemodynamics
+
+
+def hemodynamic_kernels(P_SD, nRegions, Step, kernel_length, order=1, amplitude=1e-3):
+    """
+    Impulse-response kernels of the hemodynamic model for every region.
+
+    The Euler path of Hemodynamics is driven with a positive and a negative
+    impulse of the given amplitude. Their difference gives the first-order
+    kernel and their sum the equal-lag diagonal k2(t, t) of the second-order
+    Volterra kernel. The cross-lag terms k2(t1, t2) with t1 != t2 are not
+    estimated.
+
+    Parameters:
+    - P_SD: Parameters for each region, as in Hemodynamics.
+    - nRegions: Number of brain regions.
+    - Step: Time step between samples.
+    - kernel_length: Number of samples of every kernel.
+    - order: 1 for first-order kernels only, 2 to add the equal-lag second-order diagonal.
+    - amplitude: Size of the probing impulses.
+
+    Returns:
+    - kernels: Dictionary with "q1" and "p1" (HbR and HbT first-order kernels)
+      and, for order 2, "q2" and "p2". Each of shape (nRegions, kernel_length).
+    """
+
+    impulse = np.zeros((nRegions, kernel_length))
+    impulse[:, 0] = amplitude
+    q_plus, p_plus = Hemodynamics(impulse, P_SD, Step)
+    q_minus, p_minus = Hemodynamics(-impulse, P_SD, Step)
+
+    kernels = {
+        "q1": (q_plus - q_minus) / (2 * amplitude),
+        "p1": (p_plus - p_minus) / (2 * amplitude),
+    }
+    if order == 2:
+        kernels["q2"] = (q_plus + q_minus - 2) / (2 * amplitude**2)
+        kernels["p2"] = (p_plus + p_minus - 2) / (2 * amplitude**2)
+    return kernels
+
+
+class HemodynamicKernelCache:
+    """
+    Bounded cache of hemodynamic kernels keyed by P_SD, step and kernel length.
+
+    Kernels are kept in memory with least-recently-used eviction and, when a
+    cache directory is given, stored as .npz files so other processes can
+    reuse them.
+
+    Parameters:
+    - maxsize: Maximum number of kernel sets kept in memory.
+    - cache_dir: Optional directory for persistent kernel files.
+    """
+
+    def __init__(self, maxsize=16, cache_dir=None):
+        self.maxsize = maxsize
+        self.cache_dir = cache_dir
+        self._entries = OrderedDict()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key(P_SD, nRegions, Step, kernel_length, order):
+        """Stable key for a kernel set."""
+        digest = hashlib.sha1()
+        P_SD = np.ascontiguousarray(P_SD, dtype=float)
+        digest.update(repr((P_SD.shape, nRegions, float(Step), kernel_length, order)).encode())
+        digest.update(P_SD.tobytes())
+        return digest.hexdigest()
+
+    def get(self, P_SD, nRegions, Step, kernel_length, order=1):
+        """
+        Kernels for the given settings, computed with hemodynamic_kernels on a miss.
+        """
+        key = self.key(P_SD, nRegions, Step, kernel_length, order)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        path = None
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, f"{key}.npz")
+        if path is not None and os.path.exists(path):
+            with np.load(path) as data:
+                kernels = {name: data[name] for name in data.files}
+        else:
+            kernels = hemodynamic_kernels(P_SD, nRegions, Step, kernel_length, order)
+            if path is not None:
+                # Write under a temporary name so concurrent processes never read a partial file
+                temporary_path = f"{path}.{os.getpid()}.tmp.npz"
+                np.savez(temporary_path, **kernels)
+                os.replace(temporary_path, path)
+
+        self._entries[key] = kernels
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return kernels
+
+
+# Process-wide cache used when no cache is passed explicitly
+default_kernel_cache = HemodynamicKernelCache()
+
+
+def Hemodynamics_Convolution(Z, P_SD, Step, kernel_length=None, order=1, cache=None):
+    """
+    Hemodynamic response from cached impulse-response kernels.
+
+    Instead of integrating the model again for every neural trajectory, the
+    per-region kernels are applied to Z with FFT convolution. With order 2 the
+    equal-lag diagonal of the second-order kernel is applied to Z ** 2 as well.
+    This is not a full second-order Volterra expansion: the cross-lag products
+    Z(t - t1) Z(t - t2) with t1 != t2 are left out.
+
+    Parameters:
+    - Z: Neural activity. Shape: (nRegions, simulationLength).
+    - P_SD: Parameters for each region, as in Hemodynamics.
+    - Step: Time step between the columns of Z.
+    - kernel_length: Number of kernel samples. Defaults to 60 seconds.
+    - order: 1 for the linear response, 2 to add the equal-lag second-order term.
+    - cache: HemodynamicKernelCache to use. Defaults to a process-wide cache.
+
+    Returns:
+    - qj: Deoxyhemoglobin concentration. Shape: (nRegions, simulationLength).
+    - pj: Total hemoglobin concentration. Shape: (nRegions, simulationLength).
+    """
+
+    Z = np.asarray(Z, dtype=float)
+    nRegions, simulationLength = Z.shape
+    if kernel_length is None:
+        kernel_length = int(np.ceil(60 / Step))
+    if cache is None:
+        cache = default_kernel_cache
+
+    kernels = cache.get(P_SD, nRegions, Step, kernel_length, order)
+
+    qj = 1 + fftconvolve(Z, kernels["q1"], axes=-1)[:, :simulationLength]
+    pj = 1 + fftconvolve(Z, kernels["p1"], axes=-1)[:, :simulationLength]
+    if order == 2:
+        Z_squared = Z**2
+        qj += fftconvolve(Z_squared, kernels["q2"], axes=-1)[:, :simulationLength]
+        pj += fftconvolve(Z_squared, kernels["p2"], axes=-1)[:, :simulationLength]
+    return qj, pj
@@ -1,86 +1,662 @@
+import time
+
 import numpy as np
+from scipy.integrate import solve_ivp
+from scipy.linalg import expm
+from scipy.signal import lfilter, ss2tf
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Define constants for the hemodynamic model. These are standard values in the literature.
+H = [0.64, 0.32, 2.00, 0.32, 0.32, 2.00]
 
 
-def Hemodynamics(Z, P_SD, Step):
+def hemodynamic_parameters(P_SD, nRegions, per_region=False):
+    """
+    Per-region rate constants of the hemodynamic model.
+
+    Parameters:
+    - P_SD: Parameters for each region. A 2D array where each row represents a different parameter and each column represents a brain region, optionally with leading batch dimensions when per_region is True.
+    - nRegions: Number of brain regions.
+    - per_region: If False, the first region keeps the standard values and every other region uses the first column of P_SD, as in Hemodynamics. If True, every region uses its own column.
+
+    Returns:
+    - Kj, Yj, Tj, Tjv: Signal decay, autoregulation, transit time and viscoelastic time constants. Each of shape (..., nRegions).
+    """
+
+    P_SD = np.asarray(P_SD, dtype=float)
+    if per_region:
+        log_scales = P_SD[..., :4, :]
+    else:
+        log_scales = np.zeros((4, nRegions))
+        log_scales[:, 1:] = P_SD[:4, 0, None]
+
+    Kj = H[0] * np.exp(log_scales[..., 0, :])
+    Yj = H[1] * np.exp(log_scales[..., 1, :])
+    Tj = H[2] * np.exp(log_scales[..., 2, :])
+    Tjv = H[5] * np.exp(log_scales[..., 3, :])
+    return Kj, Yj, Tj, Tjv
+
+
+def hemodynamic_derivatives(z, Sj, fjin, Vj, qj, pj, Kj, Yj, Tj, Tjv):
+    """
+    Rate of change of the hemodynamic states for the given neural activity.
+
+    Parameters:
+    - z: Neural activity of every region.
+    - Sj, fjin, Vj, qj, pj: Vasodilatory signal, inflow, blood volume, HbR and HbT states.
+    - Kj, Yj, Tj, Tjv: Rate constants from hemodynamic_parameters.
+
+    Returns:
+    - Sj_dot, fjin_dot, Vj_dot, qj_dot, pj_dot: Rates of change of the states.
+    - fjout: Outflow.
+    - Efp: Oxygen extraction fraction.
+    """
+
+    phi = H[3]
+    Sj_dot = z - Kj * Sj - Yj * (fjin - 1)
+    fjin_dot = Sj
+    fv_s = Vj ** (1 / phi)
+    Vj_dot = (fjin - fv_s) / (Tj * Tjv * Vj)
+    fjout = fv_s + Tjv * Vj_dot
+    Efp = (1 - (1 - H[4]) ** (1 / fjin)) / H[4]
+    qj_dot = ((fjin * Efp - fjout * qj) / Vj) / (Tj * qj)
+    pj_dot = (fjin - (fjout * pj) / Vj) / Tj
+    return Sj_dot, fjin_dot, Vj_dot, qj_dot, pj_dot, fjout, Efp
+
+
+def _euler_kernel(Z, Step, Kj, Yj, Tj, Tjv, Sj, fjin, Vj, qj, pj, out_q, out_p, out_fjout, out_Efp, diagnostics):
+    """
+    Forward Euler sweep of the hemodynamic model with in-place NumPy updates.
+
+    The states Sj, fjin, Vj, qj and pj hold the values at the first time point
+    and are advanced in place; HbR and HbT are written into out_q and out_p, and
+    the outflow and extraction fraction into out_fjout and out_Efp when
+    diagnostics is True. The operations follow hemodynamic_derivatives exactly.
+    """
+
+    nRegions, simulationLength = Z.shape
+    inv_phi = 1 / H[3]
+    TjTjv = Tj * Tjv
+    fv_s, Vj_dot, fjout, Efp, qj_dot, pj_dot, Sj_dot, tmp = np.empty((8, nRegions))
+
+    for t in range(1, simulationLength):
+        # Compute changes in hemodynamic state variables across all regions
+        np.power(Vj, inv_phi, out=fv_s)
+        np.subtract(fjin, fv_s, out=Vj_dot)
+        np.multiply(TjTjv, Vj, out=tmp)
+        Vj_dot /= tmp
+        np.multiply(Tjv, Vj_dot, out=fjout)
+        fjout += fv_s
+        np.divide(1, fjin, out=Efp)
+        np.power(1 - H[4], Efp, out=Efp)
+        np.subtract(1, Efp, out=Efp)
+        Efp /= H[4]
+        np.multiply(fjin, Efp, out=qj_dot)
+        np.multiply(fjout, qj, out=tmp)
+        qj_dot -= tmp
+        qj_dot /= Vj
+        np.multiply(Tj, qj, out=tmp)
+        qj_dot /= tmp
+        np.multiply(fjout, pj, out=pj_dot)
+        pj_dot /= Vj
+        np.subtract(fjin, pj_dot, out=pj_dot)
+        pj_dot /= Tj
+        np.multiply(Kj, Sj, out=Sj_dot)
+        np.subtract(Z[:, t - 1], Sj_dot, out=Sj_dot)
+        np.subtract(fjin, 1, out=tmp)
+        tmp *= Yj
+        Sj_dot -= tmp
+
+        # Update the state variables for the next time point using the Euler method
+        np.multiply(Sj, Step, out=tmp)
+        fjin += tmp
+        Sj_dot *= Step
+        Sj += Sj_dot
+        Vj_dot *= Step
+        Vj += Vj_dot
+        qj_dot *= Step
+        qj += qj_dot
+        pj_dot *= Step
+        pj += pj_dot
+
+        out_q[:, t] = qj
+        out_p[:, t] = pj
+        if diagnostics:
+            out_fjout[:, t] = fjout
+            out_Efp[:, t] = Efp
+
+
+if numba is not None:
+    # Module-level floats are frozen as constants by numba, unlike the H list
+    _PHI = H[3]
+    _E0 = H[4]
+
+    # No on-disk cache: it records the module name, and this module is
+    # imported both as src.components and as Bilinear_model_fNIRS.src.components
+    @numba.njit
+    def _euler_kernel_jit(Z, Step, Kj, Yj, Tj, Tjv, Sj, fjin, Vj, qj, pj, out_q, out_p, out_fjout, out_Efp, diagnostics):
+        """Compiled forward Euler sweep with the same contract as _euler_kernel."""
+
+        nRegions, simulationLength = Z.shape
+        inv_phi = 1 / _PHI
+        E0 = _E0
+
+        for t in range(1, simulationLength):
+            for r in range(nRegions):
+                fv_s = Vj[r] ** inv_phi
+                Vj_dot = (fjin[r] - fv_s) / (Tj[r] * Tjv[r] * Vj[r])
+                fjout = fv_s + Tjv[r] * Vj_dot
+                Efp = (1 - (1 - E0) ** (1 / fjin[r])) / E0
+                qj_dot = ((fjin[r] * Efp - fjout * qj[r]) / Vj[r]) / (Tj[r] * qj[r])
+                pj_dot = (fjin[r] - (fjout * pj[r]) / Vj[r]) / Tj[r]
+                Sj_dot = Z[r, t - 1] - Kj[r] * Sj[r] - Yj[r] * (fjin[r] - 1)
+
+                fjin[r] += Step * Sj[r]
+                Sj[r] += Step * Sj_dot
+                Vj[r] += Step * Vj_dot
+                qj[r] += Step * qj_dot
+                pj[r] += Step * pj_dot
+
+                out_q[r, t] = qj[r]
+                out_p[r, t] = pj[r]
+                if diagnostics:
+                    out_fjout[r, t] = fjout
+                    out_Efp[r, t] = Efp
+
+else:
+    _euler_kernel_jit = None
+
+
+def _select_kernel(backend):
+    """Euler kernel for the requested backend."""
+
+    if backend not in ("auto", "numba", "numpy"):
+        raise ValueError("backend must be 'auto', 'numba' or 'numpy'")
+    if backend == "numba" and _euler_kernel_jit is None:
+        raise ImportError("The numba backend requires the numba package")
+    if backend != "numpy" and _euler_kernel_jit is not None:
+        return _euler_kernel_jit
+    return _euler_kernel
+
+
+def _hemodynamic_rhs(X, z, rates):
+    """Stacked rates of change of the (Sj, fjin, Vj, qj, pj) state X of shape (5, nRegions)."""
+
+    return np.array(hemodynamic_derivatives(z, *X, *rates)[:5])
+
+
+def _hemodynamic_jacobian(X, z, rates, X_dot):
+    """Forward-difference Jacobian of _hemodynamic_rhs per region. Shape: (nRegions, 5, 5)."""
+
+    J = np.empty((X.shape[1], 5, 5))
+    for j in range(5):
+        eps = 1e-7 * np.maximum(1.0, np.abs(X[j]))
+        X_eps = X.copy()
+        X_eps[j] += eps
+        J[:, :, j] = ((_hemodynamic_rhs(X_eps, z, rates) - X_dot) / eps).T
+    return J
+
+
+def _euler_step(X, z, h, rates):
+    """Forward Euler step."""
+
+    return X + h * _hemodynamic_rhs(X, z, rates)
+
+
+def _rk4_step(X, z, h, rates):
+    """Classical fourth-order Runge-Kutta step with the input held constant."""
+
+    k1 = _hemodynamic_rhs(X, z, rates)
+    k2 = _hemodynamic_rhs(X + h / 2 * k1, z, rates)
+    k3 = _hemodynamic_rhs(X + h / 2 * k2, z, rates)
+    k4 = _hemodynamic_rhs(X + h * k3, z, rates)
+    return X + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+
+
+def _exponential_euler_step(X, z, h, rates):
+    """
+    Exponential Euler (local linearization) step. The model is linearized per
+    region at X and the linear system is solved exactly over the step through
+    the matrix exponential of the augmented Jacobian.
+    """
+
+    X_dot = _hemodynamic_rhs(X, z, rates)
+    J = _hemodynamic_jacobian(X, z, rates, X_dot)
+    M = np.zeros((X.shape[1], 6, 6))
+    M[:, :5, :5] = h * J
+    M[:, :5, 5] = h * X_dot.T
+    return X + expm(M)[:, :5, 5].T
+
+
+def _log_rhs(L, z, rates):
+    """
+    Rates of change of the log-state L, which holds Sj and the logarithms of
+    fjin, Vj, qj and pj.
+    """
+
+    X = L.copy()
+    X[1:] = np.exp(L[1:])
+    X_dot = _hemodynamic_rhs(X, z, rates)
+    X_dot[1:] /= X[1:]
+    return X_dot
+
+
+def _log_euler_step(X, z, h, rates):
+    """
+    Forward Euler step on the log-state. fjin, Vj, qj and pj are updated
+    multiplicatively and therefore stay positive for any step size.
+    """
+
+    X_dot = _hemodynamic_rhs(X, z, rates)
+    X_new = X + h * X_dot
+    X_new[1:] = X[1:] * np.exp(h * X_dot[1:] / X[1:])
+    return X_new
+
+
+def _log_rk4_step(X, z, h, rates):
+    """Fourth-order Runge-Kutta step on the log-state."""
+
+    L = X.copy()
+    L[1:] = np.log(X[1:])
+    k1 = _log_rhs(L, z, rates)
+    k2 = _log_rhs(L + h / 2 * k1, z, rates)
+    k3 = _log_rhs(L + h / 2 * k2, z, rates)
+    k4 = _log_rhs(L + h * k3, z, rates)
+    L += h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+    L[1:] = np.exp(L[1:])
+    return L
+
+
+_STEPPERS = {
+    "euler": _euler_step,
+    "rk4": _rk4_step,
+    "expeuler": _exponential_euler_step,
+    "logeuler": _log_euler_step,
+    "logrk4": _log_rk4_step,
+}
+
+# Number of samples between finiteness checks of the Euler kernels
+_FINITE_CHECK_INTERVAL = 1024
+
+
+def _check_finite(X, t):
+    """Raise FloatingPointError when the state X at sample t is NaN or infinite."""
+
+    if not np.isfinite(X).all():
+        regions = np.flatnonzero(~np.isfinite(X).all(axis=0))
+        raise FloatingPointError(
+            f"Hemodynamic state is not finite at sample {t} in regions {regions.tolist()}; "
+            "reduce Step, add substeps or use a log-state method"
+        )
+
+
+def _kernel_sweep(kernel, Z, Step, rates, X, check_finite, out_q, out_p, out_fjout, out_Efp, diagnostics):
+    """
+    Run an Euler kernel over Z. With check_finite the sweep is split into
+    windows sharing their first column, and the state is checked after each
+    window so a blow-up stops the run early.
+    """
+
+    if not check_finite:
+        kernel(Z, Step, *rates, *X, out_q, out_p, out_fjout, out_Efp, diagnostics)
+        return
+
+    simulationLength = Z.shape[1]
+    for start in range(0, simulationLength - 1, _FINITE_CHECK_INTERVAL):
+        stop = min(start + _FINITE_CHECK_INTERVAL, simulationLength - 1)
+        window = slice(start, stop + 1)
+        kernel(
+            Z[:, window], Step, *rates, *X,
+            *(out[:, window] for out in (out_q, out_p, out_fjout, out_Efp)), diagnostics,
+        )
+        _check_finite(X, stop)
+
+
+def _stepper_sweep(Z, Step, rates, X, method, substeps, check_finite, out_q, out_p, out_fjout, out_Efp, diagnostics):
+    """
+    Advance the stacked state X in place with a fixed-step integrator, holding
+    Z[:, t - 1] constant over every output step split into substeps. With
+    check_finite the state is checked after every output step.
+    """
+
+    step = _STEPPERS[method]
+    h = Step / substeps
+    for t in range(1, Z.shape[1]):
+        z = Z[:, t - 1]
+        if diagnostics:
+            out_fjout[:, t], out_Efp[:, t] = hemodynamic_derivatives(z, *X, *rates)[5:]
+        for _ in range(substeps):
+            X[:] = step(X, z, h, rates)
+        if check_finite:
+            _check_finite(X, t)
+        out_q[:, t] = X[3]
+        out_p[:, t] = X[4]
+
+
+def _adaptive_sweep(Z, Step, rates, X, rtol, atol, check_finite, out_q, out_p, out_fjout, out_Efp, diagnostics):
+    """
+    Advance the stacked state X in place with solve_ivp, holding Z[:, t - 1]
+    constant between samples as the fixed-step integrators do.
+
+    The solver restarts wherever the held column changes, so its error control
+    never steps across a jump in the input. As neural activity usually changes
+    at every sample, this is one solve_ivp call per sample: the method is a
+    tolerance-controlled reference for the fixed-step integrators, not a fast path.
+    """
+
+    nRegions, simulationLength = Z.shape
+    if simulationLength < 2:
+        return
+
+    states = np.empty((5, nRegions, simulationLength))
+    states[:, :, 0] = X
+    changes = np.flatnonzero(np.any(Z[:, 1:-1] != Z[:, :-2], axis=0)) + 1
+    edges = np.concatenate(([0], changes, [simulationLength - 1]))
+
+    for start, stop in zip(edges[:-1], edges[1:]):
+        z = Z[:, start]
+        solution = solve_ivp(
+            lambda t, x: _hemodynamic_rhs(x.reshape(5, nRegions), z, rates).ravel(),
+            (start * Step, stop * Step),
+            X.ravel(),
+            t_eval=np.arange(start + 1, stop + 1) * Step,
+            rtol=rtol,
+            atol=atol,
+        )
+        if not solution.success:
+            raise RuntimeError(f"solve_ivp failed: {solution.message}")
+
+        states[:, :, start + 1 : stop + 1] = solution.y.reshape(5, nRegions, -1)
+        X[:] = states[:, :, stop]
+        if check_finite:
+            finite = np.isfinite(states[:, :, start + 1 : stop + 1]).all(axis=(0, 1))
+            if not finite.all():
+                t = start + 1 + int(np.argmin(finite))
+                _check_finite(states[:, :, t], t)
+
+    out_q[:, 1:] = states[3, :, 1:]
+    out_p[:, 1:] = states[4, :, 1:]
+    if diagnostics:
+        out_fjout[:, 1:], out_Efp[:, 1:] = hemodynamic_derivatives(
+            Z[:, :-1], *states[:, :, :-1], *(rate[:, None] for rate in rates)
+        )[5:]
+
+
+def Hemodynamics(
+    Z,
+    P_SD,
+    Step,
+    initial_state=None,
+    return_state=False,
+    return_diagnostics=False,
+    backend="auto",
+    method="euler",
+    substeps=1,
+    rtol=1e-6,
+    atol=1e-9,
+    check_finite=True,
+):
     """
     Simulate the hemodynamic response for multiple brain regions using a bilinear model.
 
     Parameters:
     - Z: Neural activity. A 2D array of shape (nRegions, simulationLength) where each row represents a brain region and each column represents a time point.
     - P_SD: Parameters for each region. A 2D array where each row represents a different parameter and each column represents a brain region.
-    - Step: Time step for the Euler method.
+    - Step: Time step between the columns of Z.
+    - initial_state: Optional (Sj, fjin, Vj, qj, pj) state at the first time point, each of shape (nRegions,). Defaults to the resting state.
+    - return_state: If True, also return the (Sj, fjin, Vj, qj, pj) state at the last time point, so a later call can continue from it.
+    - return_diagnostics: If True, also return the outflow and oxygen extraction traces.
+    - backend: "numba" uses the compiled Euler kernel, "numpy" the in-place NumPy kernel, and "auto" picks numba when it is installed. The NumPy kernel reproduces the original loop bit for bit; the compiled kernel agrees to rounding (about 1e-16).
+    - method: "euler" (forward Euler), "rk4" (fourth-order Runge-Kutta), "expeuler" (exponential Euler / local linearization), "logeuler" and "logrk4" (Euler and Runge-Kutta on the log of fjin, Vj, qj and pj, which keeps them positive at coarse steps) or "adaptive" (solve_ivp with rtol/atol, restarted at every change of the held input; a slow reference for the fixed-step methods). Every method holds Z[:, t - 1] constant between samples.
+    - substeps: Number of integrator steps per column of Z for the fixed-step methods.
+    - rtol, atol: Tolerances of the "adaptive" method.
+    - check_finite: If True, raise FloatingPointError as soon as the state becomes NaN or infinite instead of returning a corrupted trace.
 
     Returns:
     - qj: Deoxyhemoglobin concentration. A 2D array of shape (nRegions, simulationLength) where each row represents a brain region and each column represents a time point.
     - pj: Total hemoglobin concentration. A 2D array of shape (nRegions, simulationLength) where each row represents a brain region and each column represents a time point.
+    - state: The final (Sj, fjin, Vj, qj, pj) state, only when return_state is True.
+    - fjout, Efp: Outflow and oxygen extraction fraction of shape (nRegions, simulationLength), only when return_diagnostics is True. The first column is NaN.
     """
 
     # Determine the number of brain regions and simulation length
     nRegions, simulationLength = Z.shape
+    Z = np.asarray(Z, dtype=float)
 
-    # Initialization of hemodynamic state variables for each of the nRegions over the simulation time
+    if method not in ("adaptive", *_STEPPERS):
+        raise ValueError(
+            "method must be 'euler', 'rk4', 'expeuler', 'logeuler', 'logrk4' or 'adaptive'"
+        )
+    kernel = _select_kernel(backend)
 
-    # Vasodilatory Signal variable for all regions
-    Sj = np.full((nRegions, simulationLength), np.nan)
-    Sj[:, 0] = np.zeros(nRegions)
+    # Current (Sj, fjin, Vj, qj, pj) state, starting at rest unless a previous state is given
+    X = np.ones((5, nRegions))
+    if initial_state is None:
+        X[0] = 0
+    else:
+        X[:] = initial_state
 
-    # Rate of blood volume for all regions
-    Vj = np.zeros((nRegions, simulationLength))
-    Vj[:, 0] = np.exp(np.zeros(nRegions))
+    # Only HbR and HbT are kept over time; outflow and extraction are opt-in
+    out_q = np.empty((nRegions, simulationLength))
+    out_p = np.empty((nRegions, simulationLength))
+    out_q[:, 0] = X[3]
+    out_p[:, 0] = X[4]
+    if return_diagnostics:
+        out_fjout = np.full((nRegions, simulationLength), np.nan)
+        out_Efp = np.full((nRegions, simulationLength), np.nan)
+    else:
+        out_fjout = out_Efp = np.empty((0, 0))
 
-    # HbT concentration (Rate) for all regions
-    pj = np.full((nRegions, simulationLength), np.nan)
-    pj[:, 0] = np.exp(np.zeros(nRegions))
+    # Extract and adjust parameters for each of the nRegions
+    rates = hemodynamic_parameters(P_SD, nRegions)
+    outputs = (out_q, out_p, out_fjout, out_Efp, return_diagnostics)
 
-    # HbR concentration (Rate) for all regions
-    qj = np.full((nRegions, simulationLength), np.nan)
-    qj[:, 0] = np.exp(np.zeros(nRegions))
+    if method == "euler" and substeps == 1:
+        _kernel_sweep(kernel, Z, Step, rates, X, check_finite, *outputs)
+    elif method == "adaptive":
+        _adaptive_sweep(Z, Step, rates, X, rtol, atol, check_finite, *outputs)
+    else:
+        _stepper_sweep(Z, Step, rates, X, method, substeps, check_finite, *outputs)
 
-    # Inflow for all regions
-    fjin = np.full((nRegions, simulationLength), np.nan)
-    fjin[:, 0] = np.exp(np.zeros(nRegions))
-    fjout_s = np.full((nRegions, simulationLength), np.nan)
-    fjout_s1 = np.full((nRegions, simulationLength), np.nan)
+    results = (out_q, out_p)
+    if return_state:
+        results += (tuple(X),)
+    if return_diagnostics:
+        results += (out_fjout, out_Efp)
+    return results
 
-    # Define constants for the hemodynamic model. These are standard values in the literature.
-    H = [0.64, 0.32, 2.00, 0.32, 0.32, 2.00]
 
-    # Extract and adjust parameters for each of the nRegions
+def _linearized_filters(rates, Step, discretization):
+    """
+    IIR filters of the hemodynamic model linearized at rest, for one set of
+    rate constants per region.
 
-    Kj = H[0] * np.exp(np.concatenate(([0], [P_SD[0, 0] for _ in range(nRegions - 1)])))
-    Yj = H[1] * np.exp(np.concatenate(([0], [P_SD[1, 0] for _ in range(nRegions - 1)])))
-    Tj = H[2] * np.exp(np.concatenate(([0], [P_SD[2, 0] for _ in range(nRegions - 1)])))
-    Tjv = H[5] * np.exp(
-        np.concatenate(([0], [P_SD[3, 0] for _ in range(nRegions - 1)]))
-    )
-    phi = H[3]
+    Returns the numerators (2, order + 1) for HbR and HbT and the shared
+    denominator of every region.
+    """
 
-    # Hemodynamics simulation for each time point using the Euler method for all regions
-    for t in range(1, simulationLength):
-        # Compute changes in hemodynamic state variables across all regions
-        Sj_dot = Z[:, t - 1] - Kj * Sj[:, t - 1] - Yj * (fjin[:, t - 1] - 1)
-        fjin_dot = Sj[:, t - 1]
-        fv_s = Vj[:, t - 1] ** (1 / phi)
-        Vj_dot = (fjin[:, t - 1] - fv_s) / (Tj * Tjv * Vj[:, t - 1])
-        fjout = fv_s + Tjv * Vj_dot
-        Efp = (1 - (1 - H[4]) ** (1 / fjin[:, t - 1])) / H[4]
-        qj_dot = ((fjin[:, t - 1] * Efp - fjout * qj[:, t - 1]) / Vj[:, t - 1]) / (
-            Tj * qj[:, t - 1]
-        )
-        pj_dot = (fjin[:, t - 1] - (fjout * pj[:, t - 1]) / Vj[:, t - 1]) / Tj
+    nRegions = len(rates[0])
+    X_rest = np.ones((5, nRegions))
+    X_rest[0] = 0
+    z_rest = np.zeros(nRegions)
+
+    # Central differences around the resting state
+    J = np.empty((nRegions, 5, 5))
+    eps = 1e-6
+    for j in range(5):
+        X_plus, X_minus = X_rest.copy(), X_rest.copy()
+        X_plus[j] += eps
+        X_minus[j] -= eps
+        J[:, :, j] = (
+            (_hemodynamic_rhs(X_plus, z_rest, rates) - _hemodynamic_rhs(X_minus, z_rest, rates))
+            / (2 * eps)
+        ).T
+
+    B_in = np.zeros((5, 1))
+    B_in[0] = 1  # neural activity drives the vasodilatory signal
+    C_out = np.zeros((2, 5))
+    C_out[0, 3] = C_out[1, 4] = 1
+
+    filters = []
+    for r in range(nRegions):
+        if discretization == "euler":
+            Ad = np.eye(5) + Step * J[r]
+            Bd = Step * B_in
+        else:
+            M = np.zeros((6, 6))
+            M[:5, :5] = Step * J[r]
+            M[:5, 5:] = Step * B_in
+            E = expm(M)
+            Ad, Bd = E[:5, :5], E[:5, 5:]
+        filters.append(ss2tf(Ad, Bd, C_out, np.zeros((2, 1))))
+    return filters
 
-        # Update the state variables for the next time point for all regions using the Euler method
-        Sj[:, t] = Sj[:, t - 1] + Step * Sj_dot
-        Vj[:, t] = Vj[:, t - 1] + Step * Vj_dot
-        fjin[:, t] = fjin[:, t - 1] + Step * fjin_dot
-        qj[:, t] = qj[:, t - 1] + Step * qj_dot
-        pj[:, t] = pj[:, t - 1] + Step * pj_dot
-        fjout_s[:, t] = fjout
-        fjout_s1[:, t] = Efp
 
+def Hemodynamics_Linear(Z, P_SD, Step, discretization="euler", return_error=False):
+    """
+    Fast small-signal hemodynamics from the model linearized at rest.
+
+    Around the resting state (all flows, volumes and concentrations equal to 1)
+    the model is nearly linear for low-amplitude neural input. Each region's
+    linearization is discretized into an IIR filter and Z is filtered along the
+    time axis with lfilter, one call per distinct set of rate constants.
+
+    Parameters:
+    - Z: Neural activity. Shape: (nRegions, simulationLength).
+    - P_SD: Parameters for each region, as in Hemodynamics.
+    - Step: Time step between the columns of Z.
+    - discretization: "euler" matches the forward Euler path of Hemodynamics,
+      "zoh" discretizes the linear system exactly for piecewise-constant input.
+    - return_error: If True, also run the nonlinear Euler path and return the
+      largest absolute deviation of qj or pj from it.
+
+    Returns:
+    - qj: Deoxyhemoglobin concentration. Shape: (nRegions, simulationLength).
+    - pj: Total hemoglobin concentration. Shape: (nRegions, simulationLength).
+    - error: Linearization error, only when return_error is True.
+    """
+
+    if discretization not in ("euler", "zoh"):
+        raise ValueError("discretization must be 'euler' or 'zoh'")
+
+    Z = np.asarray(Z, dtype=float)
+    nRegions = Z.shape[0]
+    rates = hemodynamic_parameters(P_SD, nRegions)
+
+    # Regions with identical rate constants share one filter
+    unique_rates, groups = np.unique(np.column_stack(rates), axis=0, return_inverse=True)
+    groups = groups.ravel()
+    filters = _linearized_filters(tuple(unique_rates.T), Step, discretization)
+
+    qj = np.empty_like(Z)
+    pj = np.empty_like(Z)
+    for g, (numerators, denominator) in enumerate(filters):
+        regions = groups == g
+        qj[regions] = 1 + lfilter(numerators[0], denominator, Z[regions], axis=-1)
+        pj[regions] = 1 + lfilter(numerators[1], denominator, Z[regions], axis=-1)
+
+    if return_error:
+        qj_nonlinear, pj_nonlinear = Hemodynamics(Z, P_SD, Step)
+        error = float(
+            max(np.max(np.abs(qj - qj_nonlinear)), np.max(np.abs(pj - pj_nonlinear)))
+        )
+        return qj, pj, error
     return qj, pj
 
 
+def hemodynamics_integrator_report(
+    Z,
+    P_SD,
+    Step,
+    methods=("euler", "rk4", "expeuler", "adaptive"),
+    reference_substeps=32,
+):
+    """
+    Compare the hemodynamic integrators against a fine-step reference.
+
+    The reference is RK4 with reference_substeps steps per column of Z, so the
+    report shows which integrator keeps the error acceptable at the given Step.
+
+    Parameters:
+    - Z: Neural activity. Shape: (nRegions, simulationLength).
+    - P_SD: Parameters for each region.
+    - Step: Time step between the columns of Z.
+    - methods: Integrators to compare, as accepted by Hemodynamics.
+    - reference_substeps: Number of RK4 steps per column for the reference.
+
+    Returns:
+    - report: Dictionary mapping every method to its "runtime" in seconds and
+      "max_error", the largest absolute deviation of qj or pj from the reference.
+    """
+
+    qj_ref, pj_ref = Hemodynamics(
+        Z, P_SD, Step, method="rk4", substeps=reference_substeps
+    )
+
+    report = {}
+    for method in methods:
+        start = time.perf_counter()
+        qj, pj = Hemodynamics(Z, P_SD, Step, method=method)
+        runtime = time.perf_counter() - start
+        max_error = float(max(np.max(np.abs(qj - qj_ref)), np.max(np.abs(pj - pj_ref))))
+        report[method] = {"runtime": runtime, "max_error": max_error}
+    return report
+
+
+def Hemodynamics_Batch(Z, P_SD, Step, backend="auto", method="euler", check_finite=True):
+    """
+    Simulate the hemodynamic response of a whole parameter ensemble at once.
+
+    Every member and region is advanced in the same Euler sweep, and each
+    region uses its own column of P_SD instead of the first-column broadcast
+    of Hemodynamics.
+
+    Parameters:
+    - Z: Neural activity. Shape: (batch, nRegions, simulationLength).
+    - P_SD: Parameters of every member. Shape: (batch, 4, nRegions).
+    - Step: Time step for the Euler method.
+    - backend: "numba", "numpy" or "auto", as in Hemodynamics.
+    - method: "euler" or one of the other fixed-step methods of Hemodynamics, e.g. "logrk4" for coarse steps.
+    - check_finite: If True, raise FloatingPointError as soon as a member's state becomes NaN or infinite.
+
+    Returns:
+    - qj: Deoxyhemoglobin concentration. Shape: (batch, nRegions, simulationLength).
+    - pj: Total hemoglobin concentration. Shape: (batch, nRegions, simulationLength).
+    """
+
+    batch, nRegions, simulationLength = Z.shape
+    if method not in _STEPPERS:
+        raise ValueError("method must be 'euler', 'rk4', 'expeuler', 'logeuler' or 'logrk4'")
+    kernel = _select_kernel(backend)
+
+    # Members and regions are independent, so they share one flat region axis
+    Z = np.ascontiguousarray(Z, dtype=float).reshape(batch * nRegions, simulationLength)
+    rates = [
+        np.ascontiguousarray(rate).ravel()
+        for rate in hemodynamic_parameters(P_SD, nRegions, per_region=True)
+    ]
+
+    X = np.ones((5, batch * nRegions))
+    X[0] = 0
+    out_q = np.empty((batch * nRegions, simulationLength))
+    out_p = np.empty((batch * nRegions, simulationLength))
+    out_q[:, 0] = X[3]
+    out_p[:, 0] = X[4]
+    outputs = (out_q, out_p, np.empty((0, 0)), np.empty((0, 0)), False)
+
+    if method == "euler":
+        _kernel_sweep(kernel, Z, Step, rates, X, check_finite, *outputs)
+    else:
+        _stepper_sweep(Z, Step, rates, X, method, 1, check_finite, *outputs)
+
+    shape = (batch, nRegions, simulationLength)
+    return out_q.reshape(shape), out_p.reshape(shape)
+
+
 def HemoglobinConcentrations(qj, pj):
     deltaQ = (qj - 1) * (71 * (1 - 0, 65))
     deltaP = (pj - 1) * 71
@@ -0,0 +1,125 @@
+import os
+import sys
+
+import numpy as np
+from scipy.integrate import solve_ivp
+
+# Define paths to easily import custom modules.
+# The repository root is the parent of the Bilinear_model_fNIRS project folder.
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, "..", "..", ".."))
+# Adding the root directory to the system path
+sys.path.append(root_directory)
+
+from Bilinear_model_fNIRS.src.components.BilinearModel_Hemodynamics import (
+    hemodynamic_derivatives,
+    hemodynamic_parameters,
+)
+from Bilinear_model_fNIRS.src.components.BilinearModel_Neurodynamics_v1 import (
+    Neurodynamics_CompiledModel,
+)
+
+
+def NeuroHemodynamics_Model(t, X, model, Kj, Yj, Tj, Tjv):
+    """
+    Coupled neural and hemodynamic model, in the solve_ivp (t, X) convention.
+
+    Parameters:
+    - t: Current time.
+    - X: Stacked state (Z, Sj, fjin, Vj, qj, pj). Shape: (6 * nRegions,).
+    - model: Neurodynamics_CompiledModel providing the neural right-hand side.
+    - Kj, Yj, Tj, Tjv: Rate constants from hemodynamic_parameters.
+
+    Returns:
+    - dXdt: The rate of change of the stacked state.
+    """
+
+    Z, Sj, fjin, Vj, qj, pj = X.reshape(6, -1)
+    dXdt = np.empty_like(X).reshape(6, -1)
+    dXdt[0] = model(Z, t)
+    dXdt[1:] = hemodynamic_derivatives(Z, Sj, fjin, Vj, qj, pj, Kj, Yj, Tj, Tjv)[:5]
+    return dXdt.ravel()
+
+
+def NeuroHemodynamics(
+    Z0,
+    timestamps,
+    A,
+    B,
+    C,
+    U_stimulus,
+    P_SD,
+    freq=10,
+    method="LSODA",
+    rtol=1e-6,
+    atol=1e-9,
+    return_Z=False,
+):
+    """
+    Integrate the neurodynamics and hemodynamics as one coupled system.
+
+    The neural state and the hemodynamic states (s, f, v, q, p) are advanced
+    together by one adaptive solver, so the hemodynamics get step size control
+    and the Z trajectory does not have to be stored and walked a second time.
+    The solver restarts at every stimulus onset and offset, and its dense
+    output is only evaluated for the states that are returned.
+
+    Parameters:
+    - Z0: Initial neural state. Shape: (nRegions,).
+    - timestamps: Array of time points.
+    - A: Connectivity matrix. Shape: (nRegions, nRegions).
+    - B: Influence matrix. Shape: (nRegions, nRegions, number of inputs).
+    - C: Input effect matrix. Shape: (nRegions, number of inputs).
+    - U_stimulus: Stimulus input matrix. Shape: (number of inputs, number of timestamps), or a StimulusEvents object.
+    - P_SD: Hemodynamic parameters for each region.
+    - freq: Sampling frequency of U_stimulus.
+    - method: Any solve_ivp method, e.g. "LSODA", "BDF", "Radau" or "RK45".
+    - rtol, atol: Relative and absolute tolerances.
+    - return_Z: If True, also return the neural trajectory.
+
+    Returns:
+    - qj: Deoxyhemoglobin concentration. Shape: (nRegions, number of timestamps).
+    - pj: Total hemoglobin concentration. Shape: (nRegions, number of timestamps).
+    - Z: The neural state at each timestamp, only when return_Z is True.
+      Shape: (number of timestamps, nRegions).
+    """
+
+    timestamps = np.asarray(timestamps, dtype=float)
+    nRegions = len(Z0)
+    model = Neurodynamics_CompiledModel(A, B, C, U_stimulus, freq)
+    rates = hemodynamic_parameters(P_SD, nRegions)
+
+    # Neural state followed by the resting hemodynamic state
+    X = np.concatenate((Z0, np.zeros(nRegions), np.ones(4 * nRegions)))
+    returned = slice(0, 6 * nRegions) if return_Z else slice(4 * nRegions, 6 * nRegions)
+    outputs = np.empty((returned.stop - returned.start, len(timestamps)))
+
+    onsets = model.onsets(timestamps[0], timestamps[-1])
+    edges = np.concatenate(([timestamps[0]], onsets, [timestamps[-1]]))
+    segments = np.searchsorted(edges[1:-1], timestamps, side="right")
+
+    for s in range(len(edges) - 1):
+        indices = np.flatnonzero(segments == s)
+        if edges[s + 1] > edges[s]:
+            solution = solve_ivp(
+                lambda t, X: NeuroHemodynamics_Model(t, X, model, *rates),
+                (edges[s], edges[s + 1]),
+                X,
+                method=method,
+                rtol=rtol,
+                atol=atol,
+                dense_output=True,
+            )
+            if not solution.success:
+                raise RuntimeError(f"solve_ivp failed: {solution.message}")
+            if len(indices):
+                outputs[:, indices] = solution.sol(timestamps[indices])[returned]
+            X = solution.y[:, -1]
+        elif len(indices):
+            outputs[:, indices] = X[returned, None]
+
+    qj = outputs[-2 * nRegions : -nRegions]
+    pj = outputs[-nRegions:]
+    if return_Z:
+        return qj, pj, outputs[:nRegions].T
+    return qj, pj
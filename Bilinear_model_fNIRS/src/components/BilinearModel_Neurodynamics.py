@@ -2,7 +2,7 @@ import numpy as np
 from scipy.integrate import odeint
 
 
-def Neurodynamics_Model(Z, t, A, B, C, U):
+def Neurodynamics_Model(Z, t, A, B, C, U, freq=10):
     """
     Neurodynamics model for multiple brain regions.
 
@@ -13,6 +13,7 @@ def Neurodynamics_Model(Z, t, A, B, C, U):
     - B: Influence matrix. Shape: (nRegions, nRegions, number of inputs).
     - C: Input effect matrix. Shape: (nRegions, number of inputs).
     - U: Input matrix. Shape: (number of inputs, number of timestamps).
+    - freq: Sampling frequency of U.
 
     Returns:
     - dZdt: The rate of change of the system's state.
@@ -20,7 +21,7 @@ def Neurodynamics_Model(Z, t, A, B, C, U):
 
     # Get the number of brain regions
     nRegions = A.shape[0]
-    index = min(int(t * 10), U.shape[1] - 1)
+    index = min(int(t * freq), U.shape[1] - 1)
 
     # Calculate the contribution from the influence matrix B and the input U
     T = np.zeros(nRegions)
@@ -28,18 +29,17 @@ def Neurodynamics_Model(Z, t, A, B, C, U):
         tmp = U[uu, index] * B[:, :, uu]
         T += -0.5 * np.exp(np.sum(tmp, axis=1))
 
-    # Modify the diagonal of the connectivity matrix A
+    # Modify the diagonal of the connectivity matrix A without touching the caller's copy
     SI = np.diag(A)
     new_diag = np.exp(SI) / 2 + SI
-    A -= np.diagflat(new_diag)
-    J_t = A + T
+    J_t = A - np.diagflat(new_diag) + T
 
     # Calculate the rate of change of the system's state
     dZdt = np.dot(J_t, Z) + np.dot(C, U[:, index])
     return dZdt
 
 
-def Neurodynamics(Z0, timestamps, A, B, C, U_stimulus):
+def Neurodynamics(Z0, timestamps, A, B, C, U_stimulus, freq=10):
     """
     Integrate the neurodynamics across all brain regions.
 
@@ -50,6 +50,7 @@ def Neurodynamics(Z0, timestamps, A, B, C, U_stimulus):
     - B: Influence matrix. Shape: (nRegions, nRegions, number of inputs).
     - C: Input effect matrix. Shape: (nRegions, number of inputs).
     - U_stimulus: Stimulus input matrix. Shape: (number of inputs, number of timestamps).
+    - freq: Sampling frequency of U_stimulus.
 
     Returns:
     - Z: The system's state at each timestamp. Shape: (number of timestamps, nRegions).
@@ -59,7 +60,7 @@ def Neurodynamics(Z0, timestamps, A, B, C, U_stimulus):
         Neurodynamics_Model,
         Z0,
         t=timestamps,
-        args=(A, B, C, U_stimulus),
+        args=(A, B, C, U_stimulus, freq),
     )
 
     return Z
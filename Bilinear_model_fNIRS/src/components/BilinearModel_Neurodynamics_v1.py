@@ -1,8 +1,16 @@
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-from scipy.integrate import odeint
+import scipy.sparse
+import scipy.sparse.linalg
+from scipy.integrate import ODEintWarning, odeint, solve_ivp
+from scipy.linalg import expm
+from scipy.sparse.csgraph import connected_components
 
 
-def Neurodynamics_Model(Z, t, A, B, C, U):
+def Neurodynamics_Model(Z, t, A, B, C, U, freq=10):
     """
     Neurodynamics model for multiple brain regions.
 
@@ -13,6 +21,7 @@ def Neurodynamics_Model(Z, t, A, B, C, U):
     - B: Influence matrix. Shape: (nRegions, nRegions, number of inputs).
     - C: Input effect matrix. Shape: (nRegions, number of inputs).
     - U: Input matrix. Shape: (number of inputs, number of timestamps).
+    - freq: Sampling frequency of U.
 
     Returns:
     - dZdt: The rate of change of the system's state.
@@ -20,7 +29,7 @@ def Neurodynamics_Model(Z, t, A, B, C, U):
 
     nRegions = A.shape[0]
     nInputs = B.shape[2]
-    index = min(int(t * 10), U.shape[1] - 1)
+    index = min(int(t * freq), U.shape[1] - 1)
 
     # J_t computation according to the provided equation
     J_t = np.copy(A)
@@ -28,33 +37,770 @@ def Neurodynamics_Model(Z, t, A, B, C, U):
     for i in range(nInputs):
         J_t += U[i, index] * B[:, :, i]
 
-    # Modify the diagonal of the connectivity matrix A
+    # Modify the diagonal of the connectivity matrix A without touching the caller's copy
     SI = np.diag(A)
     new_diag = np.exp(SI) / 2 + SI
-    A -= np.diagflat(new_diag)
-    J_t = A + J_t
+    J_t = A - np.diagflat(new_diag) + J_t
 
     # Calculate the rate of change of the system's state
     dZdt = np.dot(J_t, Z) + np.dot(C, U[:, index])
     return dZdt
 
 
-def Neurodynamics(Z0, timestamps, A, B, C, U_stimulus):
+def Neurodynamics_Jacobian_terms(A):
+    """
+    Constant part of the neurodynamics Jacobian.
+
+    Applies the same diagonal adjustment as Neurodynamics_Model to a copy of A,
+    so the caller's connectivity matrix is left untouched.
+
+    Parameters:
+    - A: Connectivity matrix, dense or scipy.sparse. Shape: (..., nRegions, nRegions).
+
+    Returns:
+    - J0: Input-independent part of J_t, sparse if A is. Shape: (..., nRegions, nRegions).
+    """
+
+    if scipy.sparse.issparse(A):
+        SI = A.diagonal()
+        new_diag = np.exp(SI) / 2 + SI
+        return (2 * A - scipy.sparse.diags(new_diag)).tocsr()
+
+    SI = np.diagonal(A, axis1=-2, axis2=-1)
+    new_diag = np.exp(SI) / 2 + SI
+    A_eff = np.array(A, dtype=float)
+    diag_view = np.einsum("...ii->...i", A_eff)
+    diag_view -= new_diag
+    return A_eff + A
+
+
+def _input_slices(B):
+    """
+    Per-input influence matrices of B.
+
+    B is either a dense array of shape (nRegions, nRegions, number of inputs) or
+    a sequence of (nRegions, nRegions) matrices, one per input, which may be
+    scipy.sparse.
+    """
+
+    if isinstance(B, (list, tuple)):
+        return list(B)
+    return list(np.moveaxis(np.asarray(B, dtype=float), 2, 0))
+
+
+def _has_sparse_connectivity(A, B, C):
+    """True if any of A, the B slices or C is scipy.sparse."""
+
+    B_slices = B if isinstance(B, (list, tuple)) else []
+    return any(scipy.sparse.issparse(M) for M in [A, C, *B_slices])
+
+
+def _dense_connectivity(A, B, C):
+    """Dense A, B and C for the engines that need full matrices."""
+
+    if not _has_sparse_connectivity(A, B, C) and not isinstance(B, (list, tuple)):
+        return A, B, C
+    densify = lambda M: M.toarray() if scipy.sparse.issparse(M) else np.asarray(M)
+    B = np.stack([densify(B_i) for B_i in _input_slices(B)], axis=2)
+    return densify(A), B, densify(C)
+
+
+class Neurodynamics_JacobianCache:
+    """
+    Bounded least-recently-used cache of the Jacobian terms per input pattern.
+
+    A block design only visits a few distinct stimulus columns, so J_t and C @ u
+    are computed once per column pattern and reused for every later right-hand
+    side evaluation with the same pattern.
+
+    Parameters:
+    - maxsize: Maximum number of input patterns kept in memory.
+    """
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Cached (J_t, C @ u) for key, or None."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, J_t, Cu):
+        """Store (J_t, C @ u) for key, evicting the least recently used entry."""
+        self._entries[key] = (J_t, Cu)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+class Neurodynamics_CompiledModel:
+    """
+    Precompiled neurodynamics model for multiple brain regions.
+
+    The effective A diagonal and the per-input B slices are prepared once, and
+    every right-hand side evaluation writes into preallocated work buffers.
+    The matrices passed in are never modified, so repeated runs against the
+    same Parameters dictionary are reproducible. With a cache, J_t and C @ u are
+    looked up per distinct stimulus column, so the right-hand side reduces to a
+    dictionary lookup and one matrix-vector product.
+
+    A scipy.sparse A, B slice or C switches the model to sparse matrix-vector
+    products, with the other matrices converted to CSR, so memory and cost per
+    evaluation scale with the number of connections.
+
+    Parameters:
+    - A: Connectivity matrix, dense or scipy.sparse. Shape: (nRegions, nRegions).
+    - B: Influence matrix. Shape: (nRegions, nRegions, number of inputs), or a
+      sequence of (nRegions, nRegions) sparse matrices, one per input.
+    - C: Input effect matrix, dense or scipy.sparse. Shape: (nRegions, number of inputs).
+    - U: Input matrix. Shape: (number of inputs, number of timestamps). A
+      StimulusEvents object is looked up by its breakpoints instead.
+    - freq: Sampling frequency used to look up the stimulus column at time t.
+    - cache_size: Number of input patterns kept by the Jacobian cache. 0 disables it.
+    """
+
+    def __init__(self, A, B, C, U, freq=10, cache_size=32):
+        self.sparse = _has_sparse_connectivity(A, B, C)
+        if self.sparse:
+            A = scipy.sparse.csr_matrix(A)
+        else:
+            A, B, C = _dense_connectivity(A, B, C)
+        self.J0 = Neurodynamics_Jacobian_terms(A)
+        self.stimulus = U
+        self.U = _stimulus_matrix(U)
+        self.freq = freq
+        nRegions = self.J0.shape[0]
+
+        if self.sparse:
+            self.B = [scipy.sparse.csr_matrix(B_i) for B_i in _input_slices(B)]
+            self.C = scipy.sparse.csr_matrix(C)
+        else:
+            self.B = np.ascontiguousarray(np.moveaxis(B, 2, 0), dtype=float)
+            self.C = np.ascontiguousarray(C, dtype=float)
+            self._J_t = np.empty((nRegions, nRegions))
+            self._B_u = np.empty((nRegions, nRegions))
+            self._Cu = np.empty(nRegions)
+            self._dZdt = np.empty(nRegions)
+
+        self._sparse_factorization = None
+        self.cache = None
+        if cache_size:
+            self.cache = Neurodynamics_JacobianCache(cache_size)
+            # Columns with identical inputs share one pattern id
+            _, self._patterns = np.unique(self.U.T, axis=0, return_inverse=True)
+            self._patterns = self._patterns.ravel()
+
+    def input_index(self, t):
+        """Column of U that drives the system at time t."""
+        if _is_event_stimulus(self.stimulus):
+            return int(self.stimulus.segment_index(t))
+        return min(int(t * self.freq), self.U.shape[1] - 1)
+
+    def onsets(self, t_start, t_end):
+        """Stimulus onset and offset times in (t_start, t_end]."""
+        start_times, _, _ = _input_segments(self.stimulus, self.freq, t_start, t_end)
+        return start_times[start_times > t_start]
+
+    def _terms(self, t):
+        """J_t and C @ u at time t."""
+        index = self.input_index(t)
+        if self.cache is not None:
+            key = self._patterns[index]
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry
+
+        u = self.U[:, index]
+        if self.sparse:
+            J_t = self.J0
+            for i in np.flatnonzero(u):
+                J_t = J_t + u[i] * self.B[i]
+            entry = (J_t.tocsr(), self.C @ u)
+            if self.cache is not None:
+                self.cache.put(key, *entry)
+            return entry
+
+        np.copyto(self._J_t, self.J0)
+        for i in np.flatnonzero(u):
+            np.multiply(self.B[i], u[i], out=self._B_u)
+            self._J_t += self._B_u
+        np.dot(self.C, u, out=self._Cu)
+
+        if self.cache is not None:
+            entry = (self._J_t.copy(), self._Cu.copy())
+            self.cache.put(key, *entry)
+            return entry
+        return self._J_t, self._Cu
+
+    def jacobian(self, Z, t):
+        """
+        J_t at time t, sparse for a sparse model. The returned matrix is shared
+        with the model and must not be modified by the caller.
+        """
+        return self._terms(t)[0]
+
+    def dense_jacobian(self, Z, t):
+        """J_t at time t as a dense array, as required by odeint."""
+        J_t = self.jacobian(Z, t)
+        return J_t.toarray() if self.sparse else J_t
+
+    def factorizes_sparsely(self, max_fill=0.1):
+        """
+        True if the implicit solvers should factorize J_t as a sparse matrix.
+
+        BDF and Radau factorize I - h J_t at every Jacobian update. Locally
+        coupled graphs keep their LU factors sparse, but randomly connected
+        ones fill them in, and sparse LU is then slower than dense LU. The
+        fill of I - 0.1 (J0 + sum of the B slices) is measured once; above
+        max_fill of a dense matrix the solvers get a dense J_t instead.
+        """
+        if not self.sparse:
+            return False
+        if self._sparse_factorization is None:
+            nRegions = self.J0.shape[0]
+            J = self.J0 + sum(self.B, scipy.sparse.csr_matrix(self.J0.shape))
+            lu = scipy.sparse.linalg.splu(
+                scipy.sparse.csc_matrix(scipy.sparse.identity(nRegions) - 0.1 * J)
+            )
+            fill = (lu.L.nnz + lu.U.nnz) / nRegions**2
+            self._sparse_factorization = bool(fill <= max_fill)
+        return self._sparse_factorization
+
+    def __call__(self, Z, t):
+        """
+        Rate of change of the system's state, in the odeint (Z, t) convention.
+        For dense models the returned array is a work buffer that is overwritten
+        by the next call.
+        """
+        if self.sparse and self.cache is None:
+            # Sparse matvecs per input slice instead of assembling J_t
+            u = self.U[:, self.input_index(t)]
+            dZdt = self.J0 @ Z + self.C @ u
+            for i in np.flatnonzero(u):
+                dZdt += u[i] * (self.B[i] @ Z)
+            return dZdt
+
+        J_t, Cu = self._terms(t)
+        if self.sparse:
+            return J_t @ Z + Cu
+
+        np.dot(J_t, Z, out=self._dZdt)
+        self._dZdt += Cu
+        return self._dZdt
+
+
+def _is_event_stimulus(U):
+    """True for StimulusEvents-like stimuli, which are looked up by time rather than by sample."""
+    return hasattr(U, "segment_index")
+
+
+def _stimulus_matrix(U):
+    """
+    Stimulus columns as indexed by _stimulus_index: U itself, or the input
+    levels between the breakpoints of a StimulusEvents object.
+    """
+    if _is_event_stimulus(U):
+        return U.levels.T
+    return np.asarray(U, dtype=float)
+
+
+def _stimulus_index(U, freq, t):
+    """Stimulus column that drives the system at time t (scalar or array)."""
+    if _is_event_stimulus(U):
+        return U.segment_index(t)
+    return np.minimum((np.asarray(t) * freq).astype(int), U.shape[1] - 1)
+
+
+def _input_segments(U, freq, t_start, t_end):
+    """
+    Split the stimulus into segments where the input column is constant.
+
+    Returns the start time and first column of every segment that overlaps
+    [t_start, t_end], and the number of stimulus columns. For a
+    StimulusEvents object every segment is one row of its levels.
+    """
+
+    if _is_event_stimulus(U):
+        start_times = np.concatenate(([-np.inf], U.times))
+        starts = np.arange(len(start_times))
+        nSamples = len(start_times)
+    else:
+        nSamples = U.shape[1]
+        changes = np.flatnonzero(np.any(U[:, 1:] != U[:, :-1], axis=0)) + 1
+        starts = np.concatenate(([0], changes))
+        start_times = starts / freq
+        # Round up where k / freq * freq falls just below k, so int(t * freq) at a
+        # segment start already selects the new column
+        early = (start_times * freq).astype(int) < starts
+        start_times[early] = np.nextafter(start_times[early], np.inf)
+
+    first = max(np.searchsorted(start_times, t_start, side="right") - 1, 0)
+    last = max(np.searchsorted(start_times, t_end, side="right") - 1, 0)
+    return start_times[first : last + 1], starts[first : last + 1], nSamples
+
+
+def _linear_segment_trajectory(J, c, z0, offsets):
+    """
+    Exact solution of dZ/dt = J Z + c sampled at the given time offsets.
+
+    Uses the eigendecomposition of J when it is well conditioned, so every
+    offset is evaluated with a single matrix product, and falls back to the
+    matrix exponential of the augmented system otherwise. Leading batch
+    dimensions of J, c and z0 are integrated together.
+
+    Parameters:
+    - J: System matrix. Shape: (..., nRegions, nRegions).
+    - c: Constant input term. Shape: (..., nRegions).
+    - z0: State at offset 0. Shape: (..., nRegions).
+    - offsets: Time offsets from the segment start. Shape: (nOffsets,).
+
+    Returns:
+    - Z: States at the offsets. Shape: (nOffsets, ..., nRegions).
+    """
+
+    nRegions = J.shape[-1]
+    tau = offsets.reshape((-1,) + (1,) * (J.ndim - 1))
+    eigenvalues, V = np.linalg.eig(J)
+
+    if np.all(np.linalg.cond(V) < 1e8):
+        w0 = np.linalg.solve(V, z0[..., None].astype(complex))[..., 0]
+        g = np.linalg.solve(V, c[..., None].astype(complex))[..., 0]
+        lt = tau * eigenvalues
+        E = np.exp(lt)
+        # (exp(lambda * tau) - 1) / lambda, which tends to tau for lambda -> 0
+        small = np.abs(eigenvalues) < 1e-12
+        safe = np.where(small, 1.0, eigenvalues)
+        Phi1 = np.where(small, tau, np.expm1(lt) / safe)
+        return np.einsum("...ij,...j->...i", V, E * w0 + Phi1 * g).real
+
+    M = np.zeros(J.shape[:-2] + (nRegions + 1, nRegions + 1))
+    M[..., :nRegions, :nRegions] = J
+    M[..., :nRegions, nRegions] = c
+    expM = expm(tau[..., None] * M)
+    return (
+        np.einsum("...ij,...j->...i", expM[..., :nRegions, :nRegions], z0)
+        + expM[..., :nRegions, nRegions]
+    )
+
+
+def Neurodynamics_Propagator(Z0, timestamps, A, B, C, U_stimulus, freq=10):
+    """
+    Integrate the neurodynamics exactly for a piecewise-constant stimulus.
+
+    Within each segment where the stimulus column does not change the bilinear
+    model is linear, so the state is advanced with the matrix exponential of
+    that segment's Jacobian instead of calling back into Python at every
+    integrator step.
+
+    Parameters:
+    - Z0: Initial state of the system. Shape: (..., nRegions).
+    - timestamps: Array of time points.
+    - A: Connectivity matrix. Shape: (..., nRegions, nRegions).
+    - B: Influence matrix. Shape: (..., nRegions, nRegions, number of inputs).
+    - C: Input effect matrix. Shape: (..., nRegions, number of inputs).
+    - U_stimulus: Stimulus input matrix. Shape: (number of inputs, number of timestamps),
+      or a StimulusEvents object.
+    - freq: Sampling frequency used to look up the stimulus column at time t.
+
+    Returns:
+    - Z: The system's state at each timestamp. Shape: (number of timestamps, ..., nRegions).
+    """
+
+    timestamps = np.asarray(timestamps, dtype=float)
+    J0 = Neurodynamics_Jacobian_terms(A)
+    Z = np.empty((len(timestamps),) + J0.shape[:-1])
+
+    start_times, columns, _ = _input_segments(
+        U_stimulus, freq, timestamps[0], timestamps[-1]
+    )
+    # Segment of every timestamp, using the same lookup as Neurodynamics_Model
+    sample_columns = _stimulus_index(U_stimulus, freq, timestamps)
+    U_columns = _stimulus_matrix(U_stimulus)
+    sample_segments = np.searchsorted(columns, sample_columns, side="right") - 1
+    sample_segments = np.maximum(sample_segments, 0)
+
+    z = np.broadcast_to(np.asarray(Z0, dtype=float), J0.shape[:-1])
+    t_current = timestamps[0]
+    for s, column in enumerate(columns):
+        u = U_columns[:, column]
+        J = J0 + B @ u
+        c = C @ u
+
+        indices = np.flatnonzero(sample_segments == s)
+        is_last = s == len(columns) - 1
+        offsets = timestamps[indices] - t_current
+        if not is_last:
+            offsets = np.append(offsets, start_times[s + 1] - t_current)
+
+        if len(offsets):
+            trajectory = _linear_segment_trajectory(J, c, z, offsets)
+            Z[indices] = trajectory[: len(indices)]
+            if not is_last:
+                z = trajectory[-1]
+                t_current = start_times[s + 1]
+
+    return Z
+
+
+def _integrate_segment(model, method, Z0, t_points, rtol, atol, tcrit=None):
+    """
+    Integrate a compiled model over t_points with one solver call.
+
+    Returns the states at t_points and the solver statistics.
+    """
+
+    if len(t_points) < 2:
+        return np.atleast_2d(Z0), {"nfev": 0, "njev": 0, "nsteps": 0}
+
+    if method == "LSODA":
+        Z, infodict = odeint(
+            model,
+            Z0,
+            t_points,
+            Dfun=model.dense_jacobian,
+            rtol=rtol,
+            atol=atol,
+            tcrit=tcrit,
+            full_output=True,
+        )
+        info = {
+            "nfev": int(infodict["nfe"][-1]),
+            "njev": int(infodict["nje"][-1]),
+            "nsteps": int(infodict["nst"][-1]),
+        }
+        return Z, info
+
+    options = {}
+    if rtol is not None:
+        options["rtol"] = rtol
+    if atol is not None:
+        options["atol"] = atol
+    if method != "RK45" and model.sparse and not model.factorizes_sparsely():
+        options["jac"] = lambda t, Z: model.dense_jacobian(Z, t)
+    elif method != "RK45":
+        options["jac"] = lambda t, Z: model.jacobian(Z, t).copy()
+    if model.sparse:
+        fun = lambda t, Z: model(Z, t)
+    else:
+        fun = lambda t, Z: model(Z, t).copy()
+
+    # Without t_eval solve_ivp keeps every accepted step, which gives the step count
+    solution = solve_ivp(
+        fun,
+        (t_points[0], t_points[-1]),
+        np.asarray(Z0, dtype=float),
+        method=method,
+        dense_output=True,
+        **options,
+    )
+    if not solution.success:
+        raise RuntimeError(f"solve_ivp failed: {solution.message}")
+    info = {
+        "nfev": solution.nfev,
+        "njev": solution.njev,
+        "nsteps": len(solution.t) - 1,
+    }
+    return solution.sol(t_points).T, info
+
+
+def Neurodynamics(
+    Z0,
+    timestamps,
+    A,
+    B,
+    C,
+    U_stimulus,
+    method="LSODA",
+    freq=10,
+    rtol=None,
+    atol=None,
+    breakpoints="tcrit",
+    return_info=False,
+):
     """
     Integrate the neurodynamics across all brain regions.
 
     Parameters:
     - Z0: Initial state of the system. Shape: (nRegions,).
     - timestamps: Array of time points.
-    - A: Connectivity matrix. Shape: (nRegions, nRegions).
-    - B: Influence matrix. Shape: (nRegions, nRegions, number of inputs).
-    - C: Input effect matrix. Shape: (nRegions, number of inputs).
+    - A: Connectivity matrix, dense or scipy.sparse. Shape: (nRegions, nRegions).
+    - B: Influence matrix. Shape: (nRegions, nRegions, number of inputs), or a
+      sequence of (nRegions, nRegions) sparse matrices, one per input.
+    - C: Input effect matrix, dense or scipy.sparse. Shape: (nRegions, number of inputs).
+    - U_stimulus: Stimulus input matrix. Shape: (number of inputs, number of timestamps),
+      or a StimulusEvents object, which is queried directly at every time.
+    - method: "LSODA" integrates with odeint, "BDF", "Radau" and "RK45" use
+      solve_ivp, and "propagator" uses the exact piecewise-constant solution
+      from Neurodynamics_Propagator. The implicit solvers receive the analytic
+      Jacobian J_t. With sparse inputs it stays sparse for BDF and Radau when
+      its LU factors do, see Neurodynamics_CompiledModel.factorizes_sparsely;
+      sparse inputs otherwise save memory but not solver time.
+    - freq: Sampling frequency of U_stimulus.
+    - rtol, atol: Relative and absolute tolerances. None keeps the solver defaults.
+    - breakpoints: How the stimulus onsets and offsets are handled. "tcrit"
+      passes them to odeint as critical times (solve_ivp has no equivalent and
+      restarts instead, as does odeint if it fails at a critical time),
+      "restart" starts a new solver call at every onset and offset, and None
+      integrates across them.
+    - return_info: If True, also return a dictionary with the solver statistics
+      ("nfev" right-hand side evaluations, "njev" Jacobian evaluations and
+      "nsteps" integration steps).
+
+    Returns:
+    - Z: The system's state at each timestamp. Shape: (number of timestamps, nRegions).
+    - info: Solver statistics, only when return_info is True.
+    """
+
+    timestamps = np.asarray(timestamps, dtype=float)
+    Z0 = np.asarray(Z0, dtype=float)
+
+    if method == "propagator":
+        A, B, C = _dense_connectivity(A, B, C)
+        Z = Neurodynamics_Propagator(Z0, timestamps, A, B, C, U_stimulus, freq)
+        info = {"nfev": 0, "njev": 0, "nsteps": 0}
+        return (Z, info) if return_info else Z
+    if method not in ("LSODA", "BDF", "Radau", "RK45"):
+        raise ValueError(
+            "method must be 'LSODA', 'BDF', 'Radau', 'RK45' or 'propagator'"
+        )
+    if breakpoints not in ("tcrit", "restart", None):
+        raise ValueError("breakpoints must be 'tcrit', 'restart' or None")
+
+    model = Neurodynamics_CompiledModel(A, B, C, U_stimulus, freq)
+    onsets = model.onsets(timestamps[0], timestamps[-1])
+
+    Z = None
+    if breakpoints is None or len(onsets) == 0:
+        Z, info = _integrate_segment(model, method, Z0, timestamps, rtol, atol)
+    elif breakpoints == "tcrit" and method == "LSODA":
+        # LSODA stops at the critical times but does not restart there, so at
+        # tight tolerances the jump in the input can make it fail; restart instead
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", ODEintWarning)
+            try:
+                Z, info = _integrate_segment(
+                    model, method, Z0, timestamps, rtol, atol, tcrit=onsets
+                )
+            except ODEintWarning:
+                Z = None
+    if Z is None:
+        # Restart the solver at every stimulus onset and offset
+        edges = np.concatenate(([timestamps[0]], onsets, [timestamps[-1]]))
+        segments = np.searchsorted(edges[1:-1], timestamps, side="right")
+        Z = np.empty((len(timestamps), len(Z0)))
+        info = {"nfev": 0, "njev": 0, "nsteps": 0}
+        z = Z0
+        for s in range(len(edges) - 1):
+            indices = np.flatnonzero(segments == s)
+            t_points = np.unique(
+                np.concatenate(([edges[s]], timestamps[indices], [edges[s + 1]]))
+            )
+            Z_segment, segment_info = _integrate_segment(
+                model, method, z, t_points, rtol, atol
+            )
+            Z[indices] = Z_segment[np.searchsorted(t_points, timestamps[indices])]
+            z = Z_segment[-1]
+            for key in info:
+                info[key] += segment_info[key]
+
+    if return_info:
+        return Z, info
+    return Z
+
+
+def Neurodynamics_Batch_Model(Z, t, J0, B, C, U, freq):
+    """
+    Vectorized neurodynamics model for a batch of parameter sets.
+
+    Parameters:
+    - Z: Flattened state of all batch members. Shape: (batch * nRegions,).
+    - t: Current time.
+    - J0: Input-independent Jacobian terms. Shape: (batch, nRegions, nRegions).
+    - B: Influence matrices. Shape: (batch, nRegions, nRegions, number of inputs).
+    - C: Input effect matrices. Shape: (batch, nRegions, number of inputs).
+    - U: Input matrix. Shape: (number of inputs, number of timestamps), or a StimulusEvents object.
+    - freq: Sampling frequency of U.
+
+    Returns:
+    - dZdt: The rate of change of the flattened state.
+    """
+
+    u = _stimulus_matrix(U)[:, _stimulus_index(U, freq, t)]
+    Z = Z.reshape(J0.shape[:2])
+
+    J_t = J0 + B @ u
+    dZdt = np.einsum("bij,bj->bi", J_t, Z) + C @ u
+    return dZdt.ravel()
+
+
+def Neurodynamics_Batch(Z0, timestamps, A, B, C, U_stimulus, method="LSODA", freq=10):
+    """
+    Integrate the neurodynamics of a batch of connectivity hypotheses at once.
+
+    All batch members share the stimulus and are integrated as one vectorized
+    state, so the per-call overhead of the integrator is paid once per batch.
+
+    Parameters:
+    - Z0: Initial state. Shape: (nRegions,) or (batch, nRegions).
+    - timestamps: Array of time points.
+    - A: Connectivity matrices. Shape: (batch, nRegions, nRegions).
+    - B: Influence matrices. Shape: (batch, nRegions, nRegions, number of inputs).
+    - C: Input effect matrices. Shape: (batch, nRegions, number of inputs).
+    - U_stimulus: Stimulus input matrix. Shape: (number of inputs, number of timestamps),
+      or a StimulusEvents object.
+    - method: "LSODA" integrates with odeint, "propagator" uses the exact
+      piecewise-constant solution from Neurodynamics_Propagator.
+    - freq: Sampling frequency of U_stimulus.
+
+    Returns:
+    - Z: The state of every batch member at each timestamp.
+      Shape: (batch, number of timestamps, nRegions).
+    """
+
+    batch, nRegions = A.shape[:2]
+    Z0 = np.broadcast_to(np.asarray(Z0, dtype=float), (batch, nRegions))
+
+    if method == "propagator":
+        Z = Neurodynamics_Propagator(Z0, timestamps, A, B, C, U_stimulus, freq)
+        return np.moveaxis(Z, 0, 1)
+    if method != "LSODA":
+        raise ValueError("method must be 'LSODA' or 'propagator'")
+
+    J0 = Neurodynamics_Jacobian_terms(A)
+
+    # Batch members do not interact, so the Jacobian of the flattened state is
+    # block diagonal and LSODA only needs a banded finite-difference estimate.
+    Z = odeint(
+        Neurodynamics_Batch_Model,
+        Z0.ravel(),
+        t=timestamps,
+        args=(J0, B, C, U_stimulus, freq),
+        ml=nRegions - 1,
+        mu=nRegions - 1,
+    )
+
+    return np.moveaxis(Z.reshape(len(timestamps), batch, nRegions), 0, 1)
+
+
+def Neurodynamics_Components(A, B):
+    """
+    Groups of regions that do not interact through A or any B slice.
+
+    C only connects the external inputs to the regions, so shared inputs do not
+    couple two groups and C is not part of the graph.
+
+    Parameters:
+    - A: Connectivity matrix, dense or scipy.sparse. Shape: (nRegions, nRegions).
+    - B: Influence matrix. Shape: (nRegions, nRegions, number of inputs), or a
+      sequence of (nRegions, nRegions) sparse matrices, one per input.
+
+    Returns:
+    - nComponents: Number of independent region groups.
+    - labels: Group of every region. Shape: (nRegions,).
+    """
+
+    coupling = abs(scipy.sparse.csr_matrix(A))
+    for B_i in _input_slices(B):
+        coupling = coupling + abs(scipy.sparse.csr_matrix(B_i))
+    return connected_components(coupling, directed=True, connection="weak")
+
+
+def _select_regions(M, rows, cols=None):
+    """Sub-matrix of a dense or sparse matrix for the given regions."""
+
+    M = M[rows]
+    return M if cols is None else M[:, cols]
+
+
+def _integrate_component(args):
+    """Integrate one region group; module level so it can run in a process pool."""
+
+    Z0, timestamps, A, B, C, U_stimulus, kwargs = args
+    return Neurodynamics(Z0, timestamps, A, B, C, U_stimulus, **kwargs)
+
+
+def Neurodynamics_Clustered(
+    Z0, timestamps, A, B, C, U_stimulus, n_jobs=None, **kwargs
+):
+    """
+    Integrate independent region groups separately and stitch the results.
+
+    Each connected component of the A/B coupling graph is integrated with its
+    own solver call, so small groups are not forced to the step size of the
+    stiffest one. Groups that start at rest and receive no input stay at zero
+    and are not integrated at all.
+
+    Parameters:
+    - Z0: Initial state of the system. Shape: (nRegions,).
+    - timestamps: Array of time points.
+    - A: Connectivity matrix, dense or scipy.sparse. Shape: (nRegions, nRegions).
+    - B: Influence matrix. Shape: (nRegions, nRegions, number of inputs), or a
+      sequence of (nRegions, nRegions) sparse matrices, one per input.
+    - C: Input effect matrix, dense or scipy.sparse. Shape: (nRegions, number of inputs).
     - U_stimulus: Stimulus input matrix. Shape: (number of inputs, number of timestamps).
+    - n_jobs: Number of worker processes. 1 integrates the groups serially and
+      None uses one worker per CPU.
+    - kwargs: Further options for Neurodynamics, e.g. method or freq.
+      return_info is not supported, as the groups are solved separately.
 
     Returns:
     - Z: The system's state at each timestamp. Shape: (number of timestamps, nRegions).
     """
 
-    Z = odeint(Neurodynamics_Model, Z0, timestamps, args=(A, B, C, U_stimulus))
+    if kwargs.get("return_info"):
+        raise ValueError("return_info is not supported by Neurodynamics_Clustered")
+    kwargs.pop("return_info", None)
+
+    Z0 = np.asarray(Z0, dtype=float)
+    nComponents, labels = Neurodynamics_Components(A, B)
+    slices = _input_slices(B)
+    Z = np.zeros((len(timestamps), len(Z0)))
+
+    jobs = []
+    for component in range(nComponents):
+        regions = np.flatnonzero(labels == component)
+        C_component = _select_regions(C, regions)
+        driven = (abs(C_component).sum() > 0) or np.any(Z0[regions] != 0)
+        if not driven:
+            continue
+
+        B_component = [_select_regions(B_i, regions, regions) for B_i in slices]
+        if not isinstance(B, (list, tuple)):
+            B_component = np.stack(B_component, axis=2)
+        jobs.append(
+            (
+                regions,
+                (
+                    Z0[regions],
+                    timestamps,
+                    _select_regions(A, regions, regions),
+                    B_component,
+                    C_component,
+                    U_stimulus,
+                    kwargs,
+                ),
+            )
+        )
+
+    if n_jobs == 1 or len(jobs) < 2:
+        results = map(_integrate_component, [args for _, args in jobs])
+        for (regions, _), Z_component in zip(jobs, results):
+            Z[:, regions] = Z_component
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = executor.map(_integrate_component, [args for _, args in jobs])
+            for (regions, _), Z_component in zip(jobs, results):
+                Z[:, regions] = Z_component
 
     return Z
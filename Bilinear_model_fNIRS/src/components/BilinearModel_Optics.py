@@ -1,8 +1,130 @@
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.sparse
 
+# Define standard optics parameters
+N = [0.65, 71, 2]
+P0 = N[1]
+BASE_HBR = N[1] * (1 - N[0])
 
-def BilinearModel_Optics(pj, qj, U, A):
+# Coefficients for computing the optic response of the two wavelengths from (dq, dh)
+F_P = np.array(
+    [
+        (0.0007358251 * 7.5, 0.001104715 * 6.5),
+        (0.001159306 * 7.5, 0.0007858993 * 6.5),
+    ]
+)
+
+# (dq, dh) from (pj - 1, qj - 1), and the optic response from the same deviations
+CONCENTRATION_MATRIX = np.array([(0.0, BASE_HBR), (P0, -BASE_HBR)])
+G = F_P @ CONCENTRATION_MATRIX
+
+# (dq, dh) from the optic response of the two wavelengths
+F_P_INV = np.linalg.inv(F_P)
+
+
+def _output_buffer(out, shape):
+    """Caller-supplied C-contiguous buffer of the given shape, or a new one."""
+
+    if out is None:
+        return np.empty(shape)
+    if out.shape != shape or not out.flags.c_contiguous:
+        raise ValueError(f"out must be a C-contiguous array of shape {shape}")
+    return out
+
+
+def _interleaved_response(M, first, second, out, offset=0.0, block_elements=1 << 16):
+    """
+    Apply the 2x2 matrix M to every (first - offset, second - offset) pair and
+    write the result interleaved per region into out, of shape
+    (..., 2 * nRegions, simulationLength).
+
+    Each wavelength row of out is written in place, block by block along time,
+    so the only temporary is one scratch block of about block_elements values.
+    """
+
+    *batch, nRegions, simulationLength = first.shape
+    Y = _output_buffer(out, (*batch, 2 * nRegions, simulationLength))
+    rows = Y.reshape(*batch, nRegions, 2, simulationLength)
+
+    step = max(1, block_elements // max(1, first.size // max(1, simulationLength)))
+    scratch = np.empty((*batch, nRegions, min(step, simulationLength)))
+    for start in range(0, simulationLength, step):
+        block = slice(start, start + step)
+        first_block, second_block = first[..., block], second[..., block]
+        buffer = scratch[..., : first_block.shape[-1]]
+        for wavelength in range(2):
+            row = rows[..., wavelength, block]
+            np.subtract(first_block, offset, out=row)
+            row *= M[wavelength, 0]
+            np.subtract(second_block, offset, out=buffer)
+            buffer *= M[wavelength, 1]
+            row += buffer
+    return Y
+
+
+def _chunked_inverse(M, Y, out, chunk_size):
+    """
+    Write M @ Y into out for consecutive blocks of chunk_size samples, casting
+    each block of Y to the dtype of out.
+    """
+
+    simulationLength = Y.shape[-1]
+    step = chunk_size or simulationLength
+    for start in range(0, simulationLength, step):
+        block = slice(start, start + step)
+        np.matmul(M, Y[..., block].astype(out.dtype, copy=False), out=out[..., block])
+
+
+def inverse_optical_response(Y, dtype=np.float64, chunk_size=None, out=None):
+    """
+    Recover the concentration changes from the optic response (inverse of compute_optical_response).
+
+    Parameters:
+    - Y: Optic response with the two wavelengths of each region on adjacent rows. Shape: (..., 2 * nRegions, simulationLength).
+    - dtype: Floating point type of the result, e.g. np.float32 for long recordings.
+    - chunk_size: Optional number of samples converted at a time, which bounds the temporary copies.
+    - out: Optional buffer of shape (2, ..., nRegions, simulationLength) and the given dtype.
+
+    Returns:
+    - dq: Change in deoxyhemoglobin concentration. Shape: (..., nRegions, simulationLength).
+    - dh: Change in total hemoglobin concentration. Shape: (..., nRegions, simulationLength).
+    """
+
+    Y = np.asarray(Y)
+    *batch, rows, simulationLength = Y.shape
+    nRegions = rows // 2
+    if out is None:
+        out = np.empty((2, *batch, nRegions, simulationLength), dtype=dtype)
+    elif out.shape != (2, *batch, nRegions, simulationLength) or out.dtype != dtype:
+        raise ValueError("out must have shape (2, ..., nRegions, simulationLength) and the given dtype")
+
+    pairs = Y.reshape(*batch, nRegions, 2, simulationLength)
+    _chunked_inverse(F_P_INV.astype(dtype), pairs, np.moveaxis(out, 0, -2), chunk_size)
+    return out[0], out[1]
+
+
+def optical_response_from_hemodynamics(pj, qj, out=None):
+    """
+    Compute the optic response directly from the hemodynamic states.
+
+    The concentration changes and the optics are folded into one 2x2 matrix
+    and Y is written in place, so no dq, dh or dp arrays are allocated; the
+    only temporary is a small scratch block.
+
+    Parameters:
+    - pj: Total hemoglobin concentration. Shape: (..., nRegions, simulationLength).
+    - qj: Deoxyhemoglobin concentration. Shape: (..., nRegions, simulationLength).
+    - out: Optional C-contiguous buffer of shape (..., 2 * nRegions, simulationLength) for Y.
+
+    Returns:
+    - Y: Optic response. Shape: (..., 2 * nRegions, simulationLength).
+    """
+
+    return _interleaved_response(G, pj, qj, out, offset=1.0)
+
+
+def BilinearModel_Optics(pj, qj, U, A, out=None):
     """
     Compute the optics based on the bilinear model for multiple brain regions.
 
@@ -11,6 +133,7 @@ def BilinearModel_Optics(pj, qj, U, A):
     - qj: Deoxyhemoglobin concentration. A 2D array of shape (nRegions, simulationLength).
     - U: Input matrix. Shape: (nRegions, simulationLength).
     - A: Connectivity matrix. Shape: (nRegions, nRegions).
+    - out: Optional buffer of shape (2 * nRegions, simulationLength) for Y.
 
     Returns:
     - Y: Optic response. A 2D array of shape (2 * nRegions, simulationLength).
@@ -18,99 +141,227 @@ def BilinearModel_Optics(pj, qj, U, A):
     - dq: Change in deoxyhemoglobin concentration for all brain regions.
     """
 
-    # Get the number of brain regions and the length of the simulation
-    nRegions = A.shape[0]
-    simulationLength = U.shape[1]
-
-    # Define standard optics parameters
-    N = [0.65, 71, 2]
-    P0 = N[1]
-    base_hbr = N[1] * (1 - N[0])
-
-    # Initialize variables to store the changes in concentrations and the optical response for each brain region
-    dq = np.zeros((nRegions, simulationLength))
-    dp = np.zeros((nRegions, simulationLength))
-    dh = np.zeros((nRegions, simulationLength))
-    Y = np.zeros((2 * nRegions, simulationLength))
-
-    # Coefficients for computing the optic response
-    F_P = np.array(
-        [
-            (0.0007358251 * 7.5, 0.001104715 * 6.5),
-            (0.001159306 * 7.5, 0.0007858993 * 6.5),
-        ]
-    )
-
-    # Compute the optical response for each time point and for all brain regions
-    for t in range(simulationLength):
-        dp[:, t] = (pj[:, t] - 1) * P0
-        dq[:, t] = (qj[:, t] - 1) * base_hbr
-        dh[:, t] = dp[:, t] - dq[:, t]
-
-        for r in range(nRegions):
-            dhq = np.array([dq[r, t], dh[r, t]])
-            Y_r = F_P @ dhq
-            Y[2 * r : 2 * r + 2, t] = Y_r
+    dq, dh = calculate_hemoglobin_changes(pj, qj)
+    Y = compute_optical_response(dq, dh, out=out)
 
     return Y, dh, dq
 
 
-def calculate_hemoglobin_changes(pj, qj):
+def calculate_hemoglobin_changes(pj, qj, out=None):
     """
     Calculate the changes in hemoglobin concentrations.
 
     Parameters:
     - pj: Total hemoglobin concentration. A 2D array of shape (nRegions, simulationLength).
     - qj: Deoxyhemoglobin concentration. A 2D array of shape (nRegions, simulationLength).
+    - out: Optional (dq, dh) pair of buffers shaped like pj.
 
     Returns:
     - dq: Change in deoxyhemoglobin concentration for all brain regions.
     - dh: Change in total hemoglobin concentration for all brain regions.
-    - dp: Change in total hemoglobin concentration for all brain regions.
     """
-    nRegions, simulationLength = pj.shape
-    N = [0.65, 71, 2]
-    P0 = N[1]
-    base_hbr = N[1] * (1 - N[0])
+    shape = np.shape(pj)
+    if out is None:
+        out = (None, None)
+    dq = _output_buffer(out[0], shape)
+    dh = _output_buffer(out[1], shape)
 
-    dq = np.zeros((nRegions, simulationLength))
-    dp = np.zeros((nRegions, simulationLength))
-    dh = np.zeros((nRegions, simulationLength))
-
-    for t in range(simulationLength):
-        dp[:, t] = (pj[:, t] - 1) * P0
-        dq[:, t] = (qj[:, t] - 1) * base_hbr
-        dh[:, t] = dp[:, t] - dq[:, t]
+    # dq = (qj - 1) * base_hbr and dh = (pj - 1) * P0 - dq, without a dp array
+    np.subtract(qj, 1, out=dq)
+    dq *= BASE_HBR
+    np.subtract(pj, 1, out=dh)
+    dh *= P0
+    dh -= dq
 
     return dq, dh
 
 
-def compute_optical_response(dq, dh):
+def compute_optical_response(dq, dh, out=None):
     """
     Compute the optics based on the bilinear model for multiple brain regions.
 
     Parameters:
     - dq: Change in deoxyhemoglobin concentration. A 2D array of shape (nRegions, simulationLength).
     - dh: Change in total hemoglobin concentration. A 2D array of shape (nRegions, simulationLength).
-    - A: Connectivity matrix. Shape: (nRegions, nRegions).
+    - out: Optional buffer of shape (2 * nRegions, simulationLength) for Y.
 
     Returns:
     - Y: Optic response. A 2D array of shape (2 * nRegions, simulationLength).
     """
-    nRegions, simulationLength = dq.shape
-    Y = np.zeros((2 * nRegions, simulationLength))
 
-    F_P = np.array(
-        [
-            (0.0007358251 * 7.5, 0.001104715 * 6.5),
-            (0.001159306 * 7.5, 0.0007858993 * 6.5),
-        ]
-    )
+    return _interleaved_response(F_P, dq, dh, out)
 
-    for t in range(simulationLength):
-        for r in range(nRegions):
-            dhq = np.array([dq[r, t], dh[r, t]])
-            Y_r = F_P @ dhq
-            Y[2 * r : 2 * r + 2, t] = Y_r
 
-    return Y
+class OpticalMontage:
+    """
+    Source-detector montage mapping regional concentration changes to channels.
+
+    Every channel sees a weighted set of regions through a sparse
+    channel x region sensitivity matrix holding the partial path lengths, and
+    every wavelength combines dq and dh with its own extinction coefficients.
+    The projection is one sparse matrix product per wavelength.
+
+    Parameters:
+    - sensitivity: Sparse or dense (nChannels, nRegions) matrix, or one such
+      matrix per wavelength when the partial path lengths differ between wavelengths.
+    - extinction: (nWavelengths, 2) coefficients of (dq, dh) per wavelength. Defaults to F_P.
+    """
+
+    def __init__(self, sensitivity, extinction=F_P):
+        self.extinction = np.asarray(extinction, dtype=float)
+        if self.extinction.ndim != 2 or self.extinction.shape[1] != 2:
+            raise ValueError("extinction must have shape (nWavelengths, 2)")
+        nWavelengths = self.extinction.shape[0]
+
+        if isinstance(sensitivity, (list, tuple)):
+            if len(sensitivity) != nWavelengths:
+                raise ValueError("One sensitivity matrix is required per wavelength")
+            matrices = [scipy.sparse.csr_matrix(S) for S in sensitivity]
+        else:
+            matrices = [scipy.sparse.csr_matrix(sensitivity)] * nWavelengths
+        if len({S.shape for S in matrices}) != 1:
+            raise ValueError("All sensitivity matrices must have the same shape")
+        self.sensitivity = matrices
+        self.nChannels, self.nRegions = matrices[0].shape
+        self.nWavelengths = nWavelengths
+        self._pseudo_inverse = None
+
+    @classmethod
+    def identity(cls, nRegions, extinction=F_P):
+        """
+        Montage with one channel per region, equivalent to compute_optical_response.
+        """
+        return cls(scipy.sparse.identity(nRegions, format="csr"), extinction)
+
+    @classmethod
+    def from_positions(
+        cls,
+        source_positions,
+        detector_positions,
+        region_positions,
+        max_separation=30.0,
+        width=10.0,
+        cutoff=3.0,
+        extinction=F_P,
+    ):
+        """
+        Montage from optode and region coordinates.
+
+        Every source-detector pair closer than max_separation forms a channel.
+        A region contributes to a channel with a Gaussian weight of its distance
+        to the channel midpoint, scaled by the source-detector separation as a
+        partial path length, and is dropped beyond cutoff widths so the matrix
+        stays sparse.
+
+        Parameters:
+        - source_positions: Source coordinates. Shape: (nSources, dims).
+        - detector_positions: Detector coordinates. Shape: (nDetectors, dims).
+        - region_positions: Region coordinates. Shape: (nRegions, dims).
+        - max_separation: Largest source-detector distance forming a channel.
+        - width: Spatial width of the channel sensitivity.
+        - cutoff: Distance, in widths, beyond which the sensitivity is set to zero.
+        - extinction: (nWavelengths, 2) coefficients of (dq, dh) per wavelength.
+
+        Returns:
+        - montage: OpticalMontage with the channels in source-major order.
+          montage.channels holds the (source, detector) index of every channel.
+        """
+        sources = np.asarray(source_positions, dtype=float)
+        detectors = np.asarray(detector_positions, dtype=float)
+        regions = np.asarray(region_positions, dtype=float)
+
+        separation = np.linalg.norm(sources[:, None] - detectors[None], axis=-1)
+        channels = np.argwhere(separation <= max_separation)
+        midpoints = (sources[channels[:, 0]] + detectors[channels[:, 1]]) / 2
+
+        distance = np.linalg.norm(midpoints[:, None] - regions[None], axis=-1)
+        weights = np.exp(-0.5 * (distance / width) ** 2)
+        weights *= separation[channels[:, 0], channels[:, 1]][:, None]
+        weights[distance > cutoff * width] = 0
+
+        montage = cls(scipy.sparse.csr_matrix(weights), extinction)
+        montage.channels = channels
+        return montage
+
+    def project(self, dq, dh, out=None):
+        """
+        Optical density change of every channel and wavelength.
+
+        Parameters:
+        - dq: Change in deoxyhemoglobin concentration. Shape: (nRegions, simulationLength).
+        - dh: Change in total hemoglobin concentration. Shape: (nRegions, simulationLength).
+        - out: Optional buffer of shape (nWavelengths, nChannels, simulationLength).
+
+        Returns:
+        - Y: Optical density change. Shape: (nWavelengths, nChannels, simulationLength).
+        """
+        nRegions, simulationLength = np.shape(dq)
+        if nRegions != self.nRegions:
+            raise ValueError(f"Expected {self.nRegions} regions, got {nRegions}")
+        Y = _output_buffer(out, (self.nWavelengths, self.nChannels, simulationLength))
+
+        regional = np.empty((nRegions, simulationLength))
+        for w, (S, (e_q, e_h)) in enumerate(zip(self.sensitivity, self.extinction)):
+            # Mix the chromophores per region first, so each wavelength needs a single sparse product
+            np.multiply(dq, e_q, out=regional)
+            regional += e_h * dh
+            Y[w] = S @ regional
+        return Y
+
+    def interleave(self, Y):
+        """
+        Rearrange (nWavelengths, nChannels, T) into (nChannels * nWavelengths, T)
+        with the wavelengths of each channel on adjacent rows, as in compute_optical_response.
+        """
+        return np.ascontiguousarray(np.swapaxes(Y, 0, 1)).reshape(-1, Y.shape[-1])
+
+    def forward_matrix(self):
+        """
+        Sparse (nWavelengths * nChannels, 2 * nRegions) matrix mapping the
+        stacked [dq; dh] to the stacked wavelengths of project.
+        """
+        return scipy.sparse.vstack(
+            [
+                scipy.sparse.hstack([e_q * S, e_h * S])
+                for S, (e_q, e_h) in zip(self.sensitivity, self.extinction)
+            ]
+        ).tocsr()
+
+    def pseudo_inverse(self):
+        """
+        Pseudo-inverse of forward_matrix, computed once per montage.
+        """
+        if self._pseudo_inverse is None:
+            self._pseudo_inverse = np.linalg.pinv(self.forward_matrix().toarray())
+        return self._pseudo_inverse
+
+    def inverse(self, Y, dtype=np.float64, chunk_size=None, out=None):
+        """
+        Least-squares concentration changes from channel optical densities
+        (modified Beer-Lambert law inverted through the montage).
+
+        Parameters:
+        - Y: Optical density change. Shape: (..., nWavelengths, nChannels, simulationLength).
+        - dtype: Floating point type of the result, e.g. np.float32 for long recordings.
+        - chunk_size: Optional number of samples converted at a time.
+        - out: Optional buffer of shape (..., 2 * nRegions, simulationLength) and the given dtype.
+
+        Returns:
+        - dq: Change in deoxyhemoglobin concentration. Shape: (..., nRegions, simulationLength).
+        - dh: Change in total hemoglobin concentration. Shape: (..., nRegions, simulationLength).
+        """
+        Y = np.asarray(Y)
+        *batch, nWavelengths, nChannels, simulationLength = Y.shape
+        if (nWavelengths, nChannels) != (self.nWavelengths, self.nChannels):
+            raise ValueError(
+                f"Expected {self.nWavelengths} wavelengths and {self.nChannels} channels"
+            )
+        shape = (*batch, 2 * self.nRegions, simulationLength)
+        if out is None:
+            out = np.empty(shape, dtype=dtype)
+        elif out.shape != shape or out.dtype != dtype:
+            raise ValueError(f"out must have shape {shape} and the given dtype")
+
+        stacked = Y.reshape(*batch, nWavelengths * nChannels, simulationLength)
+        _chunked_inverse(self.pseudo_inverse().astype(dtype), stacked, out, chunk_size)
+        return out[..., : self.nRegions, :], out[..., self.nRegions :, :]
@@ -1,6 +1,6 @@
 import os
-import random
 import sys
+from fractions import Fraction
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -16,40 +16,262 @@ sys.path.append(root_directory)
 
 from Bilinear_model_fNIRS.src.components.BilinearModel_Miscellaneous import *
 
+noise_data_directory = os.path.join(root_directory, "src", "components", "NoiseData")
+# Binary copies of the text recordings, one .npy file per source file version
+noise_cache_directory = os.path.join(noise_data_directory, ".cache")
 
-def semisynthecticDataExtraction(
-    nRegions, freq, HemodynamicSampleLength, semiSyntheticNoiseFreq=4
-):
-    # Construct the absolute paths to the files
-    deoxy_file_path = os.path.join(
-        root_directory, "src", "components", "NoiseData", "deoxyhb_1.txt"
-    )
-    oxy_file_path = os.path.join(
-        root_directory, "src", "components", "NoiseData", "oxyhb_1.txt"
+# Process-wide memory maps of the recordings, keyed by source path
+_noise_recordings = {}
+
+
+def load_noise_recording(file_path, cache_directory=None):
+    """
+    Load a NoiseData text recording through a binary memory-mapped cache.
+
+    The text file is parsed once into a .npy file named after its
+    modification time and size, so an edited recording is parsed again.
+    Later calls open the .npy file with np.load(mmap_mode="r"), and calls in
+    the same process reuse the open memory map.
+
+    Parameters:
+    - file_path: Path to the whitespace-separated text recording.
+    - cache_directory: Directory for the .npy files. Defaults to NoiseData/.cache.
+
+    Returns:
+    - data: Read-only memory-mapped array. Shape: (samples, channels).
+    """
+
+    if cache_directory is None:
+        cache_directory = noise_cache_directory
+    file_path = os.path.abspath(file_path)
+    status = os.stat(file_path)
+    key = (status.st_mtime_ns, status.st_size, cache_directory)
+
+    entry = _noise_recordings.get(file_path)
+    if entry is not None and entry[0] == key:
+        return entry[1]
+
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    cache_file = os.path.join(
+        cache_directory, f"{name}-{status.st_mtime_ns}-{status.st_size}.npy"
     )
+    if not os.path.exists(cache_file):
+        os.makedirs(cache_directory, exist_ok=True)
+        data = np.loadtxt(file_path)
+        # Write under a temporary name so concurrent processes never read a partial file
+        temporary_file = f"{cache_file}.{os.getpid()}.tmp.npy"
+        np.save(temporary_file, data)
+        os.replace(temporary_file, cache_file)
+
+    data = np.load(cache_file, mmap_mode="r")
+    _noise_recordings[file_path] = (key, data)
+    return data
+
+
+class SemisyntheticNoiseBank:
+    """
+    Index of every paired oxy/deoxy NoiseData recording.
+
+    Each recording pair (oxyhb_<k>.txt, deoxyhb_<k>.txt) is opened once
+    through load_noise_recording, and every one of its channels becomes an
+    entry of the bank. Draws pick channels, never mixing oxy and deoxy from
+    different channels, for any number of regions and realizations at once.
+
+    Parameters:
+    - directory: Directory with the recordings. Defaults to NoiseData.
+    - cache_directory: Directory for the binary caches, as in load_noise_recording.
+    """
+
+    def __init__(self, directory=None, cache_directory=None):
+        if directory is None:
+            directory = noise_data_directory
+        names = sorted(
+            name[len("deoxyhb_") : -len(".txt")]
+            for name in os.listdir(directory)
+            if name.startswith("deoxyhb_")
+            and name.endswith(".txt")
+            and os.path.exists(os.path.join(directory, "oxyhb_" + name[len("deoxyhb_") :]))
+        )
+        if not names:
+            raise FileNotFoundError(f"No paired oxyhb/deoxyhb recordings in {directory}")
+
+        self.names = names
+        self.recordings = []
+        for name in names:
+            deoxy = load_noise_recording(os.path.join(directory, f"deoxyhb_{name}.txt"), cache_directory)
+            oxy = load_noise_recording(os.path.join(directory, f"oxyhb_{name}.txt"), cache_directory)
+            if deoxy.shape != oxy.shape:
+                raise ValueError(f"oxyhb_{name}.txt and deoxyhb_{name}.txt have different shapes")
+            self.recordings.append((deoxy, oxy))
+
+        # Recording and column of every channel in the bank
+        channels = [recording[0].shape[1] for recording in self.recordings]
+        self.recording_index = np.repeat(np.arange(len(channels)), channels)
+        self.column_index = np.concatenate([np.arange(n) for n in channels])
+        # Length shared by all recordings
+        self.length = min(recording[0].shape[0] for recording in self.recordings)
+
+    def __len__(self):
+        return len(self.recording_index)
+
+    def draw(self, nRegions, realizations=None, seed=None, replace=False):
+        """
+        Draw channels of the bank for every region and realization.
+
+        Parameters:
+        - nRegions: Number of brain regions.
+        - realizations: Number of independent draws. None for a single draw without a leading axis.
+        - seed: Seed or numpy Generator for the draw.
+        - replace: If False, the regions of one realization get distinct channels.
+
+        Returns:
+        - channels: Channel indices into the bank. Shape: ([realizations,] nRegions).
+        """
+        rng = np.random.default_rng(seed)
+        nDraws = 1 if realizations is None else realizations
+        if replace:
+            channels = rng.integers(len(self), size=(nDraws, nRegions))
+        else:
+            if nRegions > len(self):
+                raise ValueError(f"Only {len(self)} channels available for {nRegions} regions")
+            channels = np.argsort(rng.random((nDraws, len(self))), axis=1)[:, :nRegions]
+        return channels[0] if realizations is None else channels
+
+    def pair(self, channel, length=None):
+        """
+        Deoxy and oxy traces of one channel, as views of the memory-mapped recording.
+
+        Parameters:
+        - channel: Channel index into the bank.
+        - length: Number of samples. Defaults to the length shared by all recordings.
+
+        Returns:
+        - deoxy, oxy: Read-only 1D views. Shape: (length,).
+        """
+        length = self.length if length is None else length
+        deoxy, oxy = self.recordings[self.recording_index[channel]]
+        column = self.column_index[channel]
+        return deoxy[:length, column], oxy[:length, column]
+
+    def take(self, channels, length=None):
+        """
+        Deoxy and oxy traces of many channels stacked into one array.
+
+        Parameters:
+        - channels: Channel indices into the bank, of any shape.
+        - length: Number of samples. Defaults to the length shared by all recordings.
+
+        Returns:
+        - noise: Deoxy (index 0) and oxy (index 1) traces. Shape: (2, *channels.shape, length).
+        """
+        length = self.length if length is None else length
+        channels = np.asarray(channels)
+        noise = np.empty((2,) + channels.shape + (length,))
+        for r, recording in enumerate(self.recordings):
+            selected = self.recording_index[channels] == r
+            columns = self.column_index[channels[selected]]
+            for chromophore in range(2):
+                noise[chromophore][selected] = recording[chromophore][:length, columns].T
+        return noise
+
+    def sample(self, nRegions, realizations=None, seed=None, length=None, replace=False):
+        """
+        Draw channels and return their stacked traces, see draw and take.
+
+        Returns:
+        - noise: Deoxy (index 0) and oxy (index 1) traces. Shape: (2, [realizations,] nRegions, length).
+        """
+        return self.take(self.draw(nRegions, realizations, seed, replace), length)
+
+
+# Bank over the shipped NoiseData recordings, opened on first use
+_default_noise_bank = None
+
+
+def default_noise_bank():
+    """SemisyntheticNoiseBank over the shipped NoiseData recordings, shared by the process."""
+    global _default_noise_bank
+    if _default_noise_bank is None:
+        _default_noise_bank = SemisyntheticNoiseBank()
+    return _default_noise_bank
+
+
+# Polyphase resampling plans keyed by (source rate, target rate, output length)
+_resampling_plans = {}
+
+
+def resampling_plan(source_rate, target_rate, length):
+    """
+    Cached rational resampling plan from source_rate to target_rate.
+
+    Parameters:
+    - source_rate: Sampling frequency of the input.
+    - target_rate: Sampling frequency of the output.
+    - length: Number of output samples.
+
+    Returns:
+    - up, down: Rational factors with up / down close to target_rate / source_rate.
+    - h: Anti-aliasing FIR filter, as designed by resample_poly.
+    - nInput: Number of input samples needed for length output samples.
+    """
+
+    key = (float(source_rate), float(target_rate), int(length))
+    plan = _resampling_plans.get(key)
+    if plan is None:
+        ratio = Fraction(target_rate / source_rate).limit_denominator(1000)
+        up, down = ratio.numerator, ratio.denominator
+        # Same low-pass design as resample_poly, which scales it by up itself
+        max_rate = max(up, down)
+        h = scipy.signal.firwin(2 * 10 * max_rate + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+        nInput = -(-int(length) * down // up)
+        plan = (up, down, h, nInput)
+        _resampling_plans[key] = plan
+    return plan
+
+
+def resample_noise(noise, source_rate, target_rate, length, axis=-1):
+    """
+    Resample noise traces from source_rate to target_rate in one polyphase pass.
+
+    All traces along the other axes are resampled together. Only the input
+    samples needed for the output are used; shorter inputs are repeated.
+
+    Parameters:
+    - noise: Noise traces sampled at source_rate along axis.
+    - source_rate: Sampling frequency of noise.
+    - target_rate: Sampling frequency of the result.
+    - length: Number of output samples.
+    - axis: Time axis of noise.
+
+    Returns:
+    - resampled: Noise sampled at target_rate, with length samples along axis.
+    """
+
+    up, down, h, nInput = resampling_plan(source_rate, target_rate, length)
+    noise = np.asarray(noise)
+    if noise.shape[axis] < nInput:
+        repeats = -(-nInput // noise.shape[axis])
+        noise = np.concatenate([noise] * repeats, axis=axis)
+    noise = np.take(noise, np.arange(nInput), axis=axis)
+    resampled = scipy.signal.resample_poly(noise, up, down, axis=axis, window=h)
+    return np.take(resampled, np.arange(length), axis=axis)
 
-    def read_random_column(file_path, nRegions):
-        with open(file_path, "r") as file:
-            data = np.loadtxt(file)
-        random_columns = []
-        for _ in range(nRegions):
-            col_index = random.randint(0, data.shape[1] - 1)
-            random_columns.append(data[:, col_index])
-        return random_columns
 
-    deoxy_data = read_random_column(deoxy_file_path, nRegions)
-    oxy_data = read_random_column(oxy_file_path, nRegions)
+def semisynthecticDataExtraction(
+    nRegions, freq, HemodynamicSampleLength, semiSyntheticNoiseFreq=4, seed=None
+):
+    # Paired deoxy/oxy channels from every NoiseData recording, only as many
+    # recorded samples as the simulation needs
+    bank = default_noise_bank()
+    channels = bank.draw(nRegions, seed=seed, replace=True)
+    nInput = resampling_plan(semiSyntheticNoiseFreq, freq, HemodynamicSampleLength)[3]
+    noise = bank.take(channels, min(nInput, bank.length))
 
-    adjusted_length = int(
-        HemodynamicSampleLength * freq / semiSyntheticNoiseFreq
-    )  # Assuming original frequency is 4Hz
-    resampled_data = []
-    for i in range(nRegions):
-        resampled_deoxy = scipy.signal.resample(deoxy_data[i], adjusted_length)
-        resampled_oxy = scipy.signal.resample(oxy_data[i], adjusted_length)
-        resampled_data.append((resampled_deoxy, resampled_oxy))
+    # One polyphase pass from the recording rate to the simulation rate for
+    # every region and both chromophores
+    resampled = resample_noise(noise, semiSyntheticNoiseFreq, freq, HemodynamicSampleLength)
 
-    return resampled_data
+    return [(resampled[0, i], resampled[1, i]) for i in range(nRegions)]
 
 
 def add_noise_to_hemodynamics_v1(
@@ -97,34 +319,22 @@ def add_noise_to_hemodynamics_v1(
 def add_noise_to_hemodynamics(
     deltaQ, deltaH, semisynthetic_noises, percent_error, timestamps
 ):
-    nRegions = deltaQ.shape[0]  # Assuming deltaQ and deltaH have shapes (nRegions, N)
-
-    # Generate and resample white noise for each region
-    whiteNoise_all_regions = np.array(
-        [generate_white_noise(timestamps) for _ in range(nRegions)]
-    )
-    whiteNoise_resampled = np.array(
-        [scipy.signal.resample(wn, deltaQ.shape[1]) for wn in whiteNoise_all_regions]
-    )
+    nRegions, nSamples = deltaQ.shape  # Assuming deltaQ and deltaH have shapes (nRegions, N)
 
-    # Initialize list to store all noises
-    all_noises = []
+    # Generate white noise for each region, resampled only if its length differs
+    whiteNoise = np.array([generate_white_noise(timestamps) for _ in range(nRegions)])
+    if whiteNoise.shape[1] != nSamples:
+        whiteNoise = scipy.signal.resample(whiteNoise, nSamples, axis=1)
 
-    # Add white noise to the list
-    for wn in whiteNoise_resampled:
-        all_noises.append((wn, wn))  # Adding twice because we have deltaQ and deltaH
+    # Deoxy and oxy noises of all regions. Shape: (number of noises, 2, N)
+    noises = np.asarray(semisynthetic_noises, dtype=float)
+    if noises.size == 0:
+        noises = np.zeros((0, 2, nSamples))
+    elif noises.shape[2] != nSamples:
+        noises = scipy.signal.resample(noises, nSamples, axis=2)
 
-    # Add semisynthetic noises to the list
-    for deoxy_noise, oxy_noise in semisynthetic_noises:
-        # Reshape or resample the noise to match the shape of deltaQ and deltaH
-        deoxy_noise_resampled = scipy.signal.resample(deoxy_noise, deltaQ.shape[1])
-        oxy_noise_resampled = scipy.signal.resample(oxy_noise, deltaH.shape[1])
-        all_noises.append((deoxy_noise_resampled, oxy_noise_resampled))
-
-    # Calculate total amplitude of all noises
-    total_noise_amp = sum(
-        max_amplitude(noise[0]) + max_amplitude(noise[1]) for noise in all_noises
-    )
+    # Total amplitude of all noises; white noise counts for deltaQ and deltaH
+    total_noise_amp = 2 * np.abs(whiteNoise).max(axis=1).sum() + np.abs(noises).max(axis=2).sum()
 
     # Calculate desired total amplitude based on percent_error
     desired_amp = max(max_amplitude(deltaQ), max_amplitude(deltaH)) * (
@@ -134,10 +344,10 @@ def add_noise_to_hemodynamics(
     # Calculate scale factor
     scale_factor = desired_amp / total_noise_amp if total_noise_amp != 0 else 0
 
-    # Apply scaled noises to deltaQ and deltaH
-    for noiseQ, noiseH in all_noises:
-        deltaQ += noiseQ * scale_factor
-        deltaH += noiseH * scale_factor
+    # Apply the scaled sum of all noises to every region of deltaQ and deltaH
+    whiteNoise_sum = whiteNoise.sum(axis=0)
+    deltaQ += (whiteNoise_sum + noises[:, 0].sum(axis=0)) * scale_factor
+    deltaH += (whiteNoise_sum + noises[:, 1].sum(axis=0)) * scale_factor
 
     return deltaQ, deltaH
 
@@ -30,7 +30,6 @@ def bilinear_model_stimulus_train_generator_constant(
     # Fill U with pulses (value 1) representing stimulus activation for each cycle
     for i in range(cycles):
         U[:, i * cycle_samples : i * cycle_samples + activation_samples] = 1
-        U[:, i * cycle_samples : i * cycle_samples + activation_samples] = 1
 
     # Create timestamps for the entire period
     Time_period = (action_time + rest_time) * cycles
@@ -96,3 +95,221 @@ def bilinear_model_stimulus_train_generator(
     timestamps = np.arange(0, Time_period, 1 / freq)
 
     return U, timestamps
+
+
+def bilinear_model_event_related_design(
+    freq,
+    nTrials,
+    nRegions,
+    isi_range=(4.0, 8.0),
+    durations=1.0,
+    amplitudes=1.0,
+    realizations=None,
+    seed=None,
+    output="dense",
+):
+    """
+    Generate randomized event-related designs for many regions and realizations at once.
+
+    Every region receives nTrials events. Each trial draws its condition
+    uniformly from the given amplitudes (and matching durations) and is
+    preceded by an inter-stimulus interval drawn uniformly from isi_range, so
+    the onsets are the cumulative sum of intervals and previous durations.
+    Onsets and durations are rounded to the sampling grid, so the dense
+    matrix and the event table describe the same stimulus.
+
+    Parameters:
+    - freq: Sampling frequency.
+    - nTrials: Number of trials per region.
+    - nRegions: Number of brain regions (stimulus inputs).
+    - isi_range: (minimum, maximum) inter-stimulus interval in seconds.
+    - durations: Trial duration in seconds, scalar or one per condition.
+    - amplitudes: Stimulus amplitude, scalar or one per condition.
+    - realizations: Number of independent designs, e.g. Monte Carlo subjects. None for a single design without a leading axis.
+    - seed: Seed or numpy Generator for the random draws.
+    - output: "dense" for the stimulus matrix, "events" for the event table.
+
+    Returns:
+    - For output "dense":
+      - U: Stimulus matrix. Shape: ([realizations,] nRegions, total number of samples).
+      - timestamps: Array of time points for each sample.
+    - For output "events":
+      - events: Structured array with one row per trial and the fields
+        "realization", "input", "condition", "onset", "duration" and
+        "amplitude", sorted by realization and onset. The rows of one
+        realization can be passed to StimulusEvents.
+    """
+
+    if output not in ("dense", "events"):
+        raise ValueError("output must be 'dense' or 'events'")
+    rng = np.random.default_rng(seed)
+    amplitudes = np.atleast_1d(np.asarray(amplitudes, dtype=float))
+    durations = np.atleast_1d(np.asarray(durations, dtype=float))
+    nConditions = max(len(amplitudes), len(durations))
+    amplitudes = np.broadcast_to(amplitudes, (nConditions,))
+    durations = np.broadcast_to(durations, (nConditions,))
+
+    # Draw every trial of every region and realization at once
+    shape = (1 if realizations is None else realizations, nRegions, nTrials)
+    conditions = rng.integers(nConditions, size=shape)
+    isi_samples = np.rint(rng.uniform(*isi_range, size=shape) * freq).astype(int)
+    duration_samples = np.maximum(np.rint(durations * freq).astype(int), 1)[conditions]
+    stops = np.cumsum(isi_samples + duration_samples, axis=-1)
+    starts = stops - duration_samples
+
+    if output == "events":
+        realization, region, _ = np.indices(shape)
+        events = np.empty(
+            starts.size,
+            dtype=[
+                ("realization", int),
+                ("input", int),
+                ("condition", int),
+                ("onset", float),
+                ("duration", float),
+                ("amplitude", float),
+            ],
+        )
+        events["realization"] = realization.ravel()
+        events["input"] = region.ravel()
+        events["condition"] = conditions.ravel()
+        events["onset"] = starts.ravel() / freq
+        events["duration"] = duration_samples.ravel() / freq
+        events["amplitude"] = amplitudes[conditions].ravel()
+        return events[np.lexsort((events["input"], events["onset"], events["realization"]))]
+
+    # Add each amplitude at its start and remove it at its stop, then accumulate
+    nSamples = int(stops.max())
+    changes = np.zeros(shape[:2] + (nSamples + 1,))
+    realization, region, _ = np.indices(shape)
+    np.add.at(changes, (realization, region, starts), amplitudes[conditions])
+    np.add.at(changes, (realization, region, stops), -amplitudes[conditions])
+    U = np.cumsum(changes[..., :nSamples], axis=-1)
+
+    timestamps = np.arange(nSamples) / freq
+    if realizations is None:
+        U = U[0]
+    return U, timestamps
+
+
+class StimulusEvents:
+    """
+    Compact stimulus made of events instead of a dense sample matrix.
+
+    Every event switches an input on at its onset for its duration with the
+    given amplitude; overlapping events on the same input add up. The events
+    are compiled once into the sorted times where any input changes and the
+    input levels in between, so the input at any time is a binary search and
+    memory grows with the number of events, not with the recording length.
+    Neurodynamics accepts a StimulusEvents object wherever a dense U is
+    expected; to_dense materializes U for plotting or export.
+
+    Parameters:
+    - onsets: Event onset times in seconds.
+    - durations: Event durations in seconds.
+    - amplitudes: Event amplitudes, scalar or one per event.
+    - inputs: Input channel of every event, scalar or one per event.
+    - nInputs: Number of input channels. Defaults to the largest channel + 1.
+    - end_time: End of the design in seconds. Defaults to the last offset.
+    """
+
+    def __init__(self, onsets, durations, amplitudes=1.0, inputs=0, nInputs=None, end_time=None):
+        onsets = np.atleast_1d(np.asarray(onsets, dtype=float))
+        durations = np.broadcast_to(np.asarray(durations, dtype=float), onsets.shape)
+        amplitudes = np.broadcast_to(np.asarray(amplitudes, dtype=float), onsets.shape)
+        inputs = np.broadcast_to(np.asarray(inputs, dtype=int), onsets.shape)
+
+        order = np.argsort(onsets, kind="stable")
+        self.onsets = onsets[order]
+        self.durations = durations[order].copy()
+        self.amplitudes = amplitudes[order].copy()
+        self.inputs = inputs[order].copy()
+        self.nInputs = int(nInputs if nInputs is not None else self.inputs.max(initial=-1) + 1)
+        offsets = self.onsets + self.durations
+        self.end_time = float(end_time if end_time is not None else offsets.max(initial=0.0))
+
+        # Level changes: +amplitude at every onset and -amplitude at every offset
+        times = np.concatenate((self.onsets, offsets))
+        steps = np.zeros((2 * len(self.onsets), self.nInputs))
+        events = np.arange(len(self.onsets))
+        steps[events, self.inputs] = self.amplitudes
+        steps[len(self.onsets) + events, self.inputs] = -self.amplitudes
+
+        # Sum the changes that happen at the same time, then accumulate them into levels
+        self.times, first = np.unique(times, return_inverse=True)
+        changes = np.zeros((len(self.times), self.nInputs))
+        np.add.at(changes, first.ravel(), steps)
+        levels = np.vstack((np.zeros((1, self.nInputs)), np.cumsum(changes, axis=0)))
+        levels[np.abs(levels) < 1e-12] = 0.0
+        # Keep only the times where some input actually changes; row 0 holds
+        # the levels before the first change
+        changed = np.any(levels[1:] != levels[:-1], axis=1)
+        self.times = self.times[changed]
+        self.levels = np.vstack((levels[:1], levels[1:][changed]))
+
+    @classmethod
+    def from_dense(cls, U, freq):
+        """
+        Events equivalent to a dense stimulus matrix sampled at freq, with one
+        event per run of constant non-zero samples of every input.
+        """
+        U = np.asarray(U, dtype=float)
+        nInputs, nSamples = U.shape
+        padded = np.zeros((nInputs, nSamples + 2))
+        padded[:, 1:-1] = U
+        # Every change of value ends one run and starts the next
+        channel, edge = np.nonzero(padded[:, 1:] != padded[:, :-1])
+        starts = edge[:-1]
+        stops = edge[1:]
+        same_input = channel[:-1] == channel[1:]
+        values = U[channel[:-1][same_input], starts[same_input]]
+        keep = values != 0
+        starts = starts[same_input][keep]
+        stops = stops[same_input][keep]
+        return cls(
+            starts / freq,
+            (stops - starts) / freq,
+            values[keep],
+            channel[:-1][same_input][keep],
+            nInputs=nInputs,
+            end_time=nSamples / freq,
+        )
+
+    @property
+    def nbytes(self):
+        """Memory held by the event arrays and the compiled levels."""
+        return sum(
+            array.nbytes
+            for array in (self.onsets, self.durations, self.amplitudes, self.inputs, self.times, self.levels)
+        )
+
+    def segment_index(self, t):
+        """Row of levels that drives the system at time t (scalar or array)."""
+        return np.searchsorted(self.times, t, side="right")
+
+    def __call__(self, t):
+        """Input levels at time t. Shape: (nInputs,) or (len(t), nInputs)."""
+        return self.levels[self.segment_index(t)]
+
+    def breakpoints(self, t_start, t_end):
+        """Times in (t_start, t_end] where any input changes."""
+        first, last = np.searchsorted(self.times, (t_start, t_end), side="right")
+        return self.times[first:last]
+
+    def to_dense(self, freq, nSamples=None):
+        """
+        Materialize the dense stimulus matrix sampled at freq.
+
+        Parameters:
+        - freq: Sampling frequency.
+        - nSamples: Number of samples. Defaults to covering end_time.
+
+        Returns:
+        - U: Stimulus matrix. Shape: (nInputs, nSamples).
+        - timestamps: Array of time points for each sample.
+        """
+        if nSamples is None:
+            nSamples = int(round(self.end_time * freq))
+        timestamps = np.arange(nSamples) / freq
+        U = np.ascontiguousarray(self(timestamps).T)
+        return U, timestamps
@@ -0,0 +1,229 @@
+import os
+import sys
+
+import numpy as np
+
+# Define paths to easily import custom modules.
+# The repository root is the parent of the Bilinear_model_fNIRS project folder.
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, "..", "..", ".."))
+# Adding the root directory to the system path
+sys.path.append(root_directory)
+
+from Bilinear_model_fNIRS.src.components.BilinearModel_Hemodynamics import Hemodynamics
+from Bilinear_model_fNIRS.src.components.BilinearModel_Neurodynamics_v1 import (
+    Neurodynamics,
+)
+from Bilinear_model_fNIRS.src.components.BilinearModel_Optics import (
+    calculate_hemoglobin_changes,
+    compute_optical_response,
+)
+
+
+def _stimulus_reader(U_stimulus, freq, nSamples=None):
+    """
+    Function that returns the stimulus columns of samples [start, stop).
+
+    Fewer columns are returned at the end of the stimulus. Dense matrices are
+    sliced, StimulusEvents objects are sampled at the requested samples only,
+    and an iterable of (number of inputs, n) chunks is read ahead as far as
+    needed, keeping only the columns from the last requested start onwards.
+    start must not decrease between calls.
+    """
+
+    if hasattr(U_stimulus, "segment_index"):
+        if nSamples is None:
+            nSamples = int(round(U_stimulus.end_time * freq))
+
+        def read(start, stop):
+            t = np.arange(start, min(stop, nSamples)) / freq
+            return np.ascontiguousarray(U_stimulus(t).T)
+
+        return read
+
+    if hasattr(U_stimulus, "shape"):
+        return lambda start, stop: U_stimulus[:, start:stop]
+
+    chunks = iter(U_stimulus)
+    buffer = None
+    offset = 0  # Sample index of the first buffered column
+
+    def read(start, stop):
+        nonlocal buffer, offset
+        while True:
+            if buffer is not None:
+                # Drop the columns before start, so skipped samples are not kept
+                skipped = min(max(start - offset, 0), buffer.shape[1])
+                buffer, offset = buffer[:, skipped:], offset + skipped
+                if offset + buffer.shape[1] >= stop:
+                    break
+            try:
+                chunk = np.asarray(next(chunks), dtype=float)
+            except StopIteration:
+                break
+            buffer = chunk if buffer is None else np.hstack((buffer, chunk))
+        if buffer is None:
+            return np.empty((0, 0))
+        return buffer[:, : stop - offset]
+
+    return read
+
+
+def fNIRS_Process_Stream(
+    Parameters,
+    U_stimulus,
+    chunk_size=1024,
+    state=None,
+    nSamples=None,
+    **neurodynamics_options,
+):
+    """
+    Run the neuro -> hemo -> optics pipeline in fixed-size time chunks.
+
+    Only one chunk of Z, qj, pj, dq, dh and Y exists at a time, and with a
+    StimulusEvents object or an iterable of stimulus chunks only the stimulus
+    columns of the current chunk are materialized, so memory does not grow
+    with the recording length. The neural state, the hemodynamic Euler state
+    and the sample index are carried across chunk boundaries, and every chunk
+    carries a checkpoint that can be passed back as state to resume.
+    Neurodynamics only sees the stimulus columns of the current chunk, on a
+    time axis that starts at the chunk, so the cost per chunk does not grow
+    with the recording length either.
+
+    Parameters:
+    - Parameters: Parameters dictionary with "A", "B", "C", "P_SD", "freq" and "step".
+    - U_stimulus: Stimulus input matrix of shape (number of inputs, number of
+      samples), a StimulusEvents object, or an iterable of stimulus matrices of
+      shape (number of inputs, any length) that together cover the session from
+      its first sample. On resume, an iterable is read from the start again and
+      the samples before the checkpoint are skipped.
+    - chunk_size: Number of samples per chunk.
+    - state: Checkpoint from a previous chunk to resume from. None starts at rest.
+    - nSamples: Number of samples of a StimulusEvents stimulus. Defaults to covering its end_time.
+    - neurodynamics_options: Further options for Neurodynamics, e.g. method.
+
+    Yields:
+    - chunk: Dictionary with "timestamps", "Z" (chunk, nRegions), "qj", "pj",
+      "dq", "dh" (nRegions, chunk), "Y" (2 * nRegions, chunk) and "state", the
+      checkpoint after the chunk.
+    """
+
+    freq = Parameters["freq"]
+    nRegions = Parameters["A"].shape[0]
+    read_stimulus = _stimulus_reader(U_stimulus, freq, nSamples)
+
+    if state is None:
+        chunk_start = 0
+        Z_last = None
+        hemodynamic_state = None
+    else:
+        chunk_start = state["index"]
+        Z_last = state["Z"]
+        hemodynamic_state = state["hemodynamics"]
+
+    while True:
+        # Stimulus window from the first integrated sample, plus the next
+        # column, which the solver may read when it steps past the chunk end
+        window_start = chunk_start if Z_last is None else chunk_start - 1
+        U_window = read_stimulus(window_start, chunk_start + chunk_size + 1)
+        chunk_stop = min(chunk_start + chunk_size, window_start + U_window.shape[1])
+        if chunk_stop <= chunk_start:
+            return
+        timestamps = np.arange(chunk_start, chunk_stop) / freq
+        t_window = np.arange(chunk_stop - window_start) / freq
+
+        if Z_last is None:
+            # First chunk: start from rest at the first sample
+            Z = Neurodynamics(
+                np.zeros(nRegions),
+                t_window,
+                Parameters["A"],
+                Parameters["B"],
+                Parameters["C"],
+                U_window,
+                freq=freq,
+                **neurodynamics_options,
+            )
+            qj, pj, hemodynamic_state = Hemodynamics(
+                Z.T, Parameters["P_SD"], Parameters["step"], return_state=True
+            )
+        else:
+            # Continue from the last sample of the previous chunk, which is
+            # integrated again as the first point and then dropped
+            Z = Neurodynamics(
+                Z_last,
+                t_window,
+                Parameters["A"],
+                Parameters["B"],
+                Parameters["C"],
+                U_window,
+                freq=freq,
+                **neurodynamics_options,
+            )
+            Z_hemodynamics = np.vstack((Z_last, Z[1:]))
+            qj, pj, hemodynamic_state = Hemodynamics(
+                Z_hemodynamics.T,
+                Parameters["P_SD"],
+                Parameters["step"],
+                initial_state=hemodynamic_state,
+                return_state=True,
+            )
+            Z, qj, pj = Z[1:], qj[:, 1:], pj[:, 1:]
+
+        dq, dh = calculate_hemoglobin_changes(pj, qj)
+        Y = compute_optical_response(dq, dh)
+
+        Z_last = Z[-1].copy()
+        checkpoint = {
+            "index": chunk_stop,
+            "Z": Z_last,
+            "hemodynamics": hemodynamic_state,
+        }
+
+        yield {
+            "timestamps": timestamps,
+            "Z": Z,
+            "qj": qj,
+            "pj": pj,
+            "dq": dq,
+            "dh": dh,
+            "Y": Y,
+            "state": checkpoint,
+        }
+        chunk_start = chunk_stop
+
+
+def save_stream_checkpoint(filename, state):
+    """
+    Save a streaming checkpoint to an .npz file.
+
+    Parameters:
+    - filename: Path of the checkpoint file.
+    - state: Checkpoint yielded by fNIRS_Process_Stream.
+    """
+
+    np.savez(
+        filename,
+        index=state["index"],
+        Z=state["Z"],
+        hemodynamics=np.vstack(state["hemodynamics"]),
+    )
+
+
+def load_stream_checkpoint(filename):
+    """
+    Load a streaming checkpoint saved with save_stream_checkpoint.
+
+    Parameters:
+    - filename: Path of the checkpoint file.
+
+    Returns:
+    - state: Checkpoint that can be passed to fNIRS_Process_Stream.
+    """
+
+    with np.load(filename) as data:
+        return {
+            "index": int(data["index"]),
+            "Z": data["Z"],
+            "hemodynamics": tuple(data["hemodynamics"]),
+        }
@@ -15,16 +15,19 @@ sys.path.append(root_directory)
 from Bilinear_model_fNIRS.src.components.BilinearModel_Miscellaneous import *
 
 
+# Mean and spread of the base frequency (Hz) of every physiological noise type
+PHYSIOLOGICAL_PARAMETERS = {
+    "heart": {"frequency": 1.08, "std_freq": 0.16},
+    "breathing": {"frequency": 0.22, "std_freq": 0.07},
+    "vasomotion": {"frequency": 0.082, "std_freq": 0.016},
+}
+
+
 def generate_physiological_noise(timestamps, parameter):
     """Generates more realistic physiological noise for a given physiological parameter."""
-    parameters = {
-        "heart": {"frequency": 1.08, "std_freq": 0.16},
-        "breathing": {"frequency": 0.22, "std_freq": 0.07},
-        "vasomotion": {"frequency": 0.082, "std_freq": 0.016},
-    }
-    if parameter not in parameters:
+    if parameter not in PHYSIOLOGICAL_PARAMETERS:
         raise ValueError("Parameter must be 'heart', 'breathing', or 'vasomotion'")
-    param_info = parameters[parameter]
+    param_info = PHYSIOLOGICAL_PARAMETERS[parameter]
     base_freq = np.abs(
         np.random.normal(param_info["frequency"], param_info["std_freq"])
     )
@@ -98,6 +101,124 @@ def synthetic_physiological_noise_model(
     return scaled_noises
 
 
+def batched_pink_noise(shape, n_points, rng):
+    """
+    Independent pink (1/f) noise traces, as pink_noise, with one irfft along the last axis.
+
+    Parameters:
+    - shape: Leading shape of the traces, e.g. (realizations, nRegions).
+    - n_points: Number of samples per trace.
+    - rng: numpy Generator.
+
+    Returns:
+    - noise: Pink noise. Shape: (*shape, n_points).
+    """
+    has_uneven_points = n_points % 2
+    nFrequencies = n_points // 2 + 1 + has_uneven_points
+    spectrum = rng.standard_normal((*shape, nFrequencies)) + 1j * rng.standard_normal(
+        (*shape, nFrequencies)
+    )
+    spectrum /= np.sqrt(np.arange(nFrequencies) + 1.0)  # Avoid divide by zero
+    return np.fft.irfft(spectrum, axis=-1)[..., :n_points]
+
+
+def generate_physiological_noise_bank(timestamps, parameter, shape, rng, num_harmonics=5):
+    """
+    Independent physiological noise traces, as generate_physiological_noise, in one broadcasted computation.
+
+    Every trace draws its own base frequency. The harmonics are built from
+    the sine and cosine of the fundamental with the recurrence
+    sin((k + 1) x) = 2 cos(x) sin(k x) - sin((k - 1) x), so the whole batch
+    needs two trigonometric evaluations per sample instead of one per harmonic.
+
+    Parameters:
+    - timestamps: Array of time points.
+    - parameter: "heart", "breathing" or "vasomotion".
+    - shape: Leading shape of the traces, e.g. (realizations, nRegions).
+    - rng: numpy Generator.
+    - num_harmonics: Number of harmonics above the fundamental.
+
+    Returns:
+    - noise: Physiological noise. Shape: (*shape, len(timestamps)).
+    """
+    if parameter not in PHYSIOLOGICAL_PARAMETERS:
+        raise ValueError("Parameter must be 'heart', 'breathing', or 'vasomotion'")
+    param_info = PHYSIOLOGICAL_PARAMETERS[parameter]
+    timestamps = np.asarray(timestamps, dtype=float)
+
+    base_freq = np.abs(rng.normal(param_info["frequency"], param_info["std_freq"], size=shape))
+    phase = 2 * np.pi * base_freq[..., None] * timestamps
+    primary_noise = np.sin(phase)
+    two_cos = 2 * np.cos(phase)
+
+    # Harmonic i has frequency (i + 1) * base_freq and weight 0.5 ** (i + 1)
+    noise = primary_noise.copy()
+    previous, current = np.zeros_like(phase), primary_noise.copy()
+    for i in range(1, num_harmonics + 1):
+        # sin((i + 1) x) overwrites sin((i - 1) x), which is no longer needed
+        np.subtract(two_cos * current, previous, out=previous)
+        previous, current = current, previous
+        noise += 0.5 ** (i + 1) * current
+
+    pink = batched_pink_noise(shape, len(timestamps), rng)
+    pink *= primary_noise.std(axis=-1, keepdims=True) / pink.std(
+        axis=-1, keepdims=True
+    )  # normalize amplitude
+    noise += pink
+    return noise
+
+
+def synthetic_physiological_noise_bank(
+    timestamps,
+    noise_types,
+    nRegions,
+    realizations=None,
+    HemodynamicSample=None,
+    percent_error=0,
+    seed=None,
+):
+    """
+    Independent synthetic noise for every region and realization.
+
+    Unlike synthetic_physiological_noise_model followed by combine_noises,
+    which share one trace per noise type across all regions, every region
+    and realization gets its own base frequencies, harmonics, pink and white
+    noise, all generated in broadcasted computations from a seeded Generator.
+
+    Parameters:
+    - timestamps: Array of time points.
+    - noise_types: Noise types to generate ("heart", "breathing", "vasomotion", "white").
+    - nRegions: Number of brain regions.
+    - realizations: Number of independent realizations, e.g. Monte Carlo subjects. None for a single realization without a leading axis.
+    - HemodynamicSample: Optional signal whose maximum amplitude sets the noise level.
+    - percent_error: Combined noise amplitude per trace as a percentage of the HemodynamicSample amplitude.
+    - seed: Seed or numpy Generator for the random draws.
+
+    Returns:
+    - noises: Noise per type. Shape: (len(noise_types), [realizations,] nRegions, len(timestamps)).
+      Summing over the first axis gives the combined noise of every region.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (nRegions,) if realizations is None else (realizations, nRegions)
+
+    noises = np.empty((len(noise_types), *shape, len(timestamps)))
+    for k, noise_type in enumerate(noise_types):
+        if noise_type == "white":
+            noises[k] = rng.normal(0, 1.0, (*shape, len(timestamps)))
+        else:
+            noises[k] = generate_physiological_noise_bank(timestamps, noise_type, shape, rng)
+
+    if HemodynamicSample is not None:
+        # Scale every trace so its noise types sum to the desired amplitude, as synthetic_physiological_noise_model
+        desired_total_noise_amp = max_amplitude(HemodynamicSample) * (percent_error / 100)
+        current_total_noise_amp = np.abs(noises).max(axis=-1).sum(axis=0)
+        if np.any(current_total_noise_amp == 0):
+            raise ValueError("Current total amplitude of noises is zero, cannot scale.")
+        noises *= (desired_total_noise_amp / current_total_noise_amp)[..., None]
+
+    return noises
+
+
 def combine_noises(noises_with_gains, nRegions):
     # Sum up all the noises
     combined_noise = np.sum(np.array(noises_with_gains), axis=0)
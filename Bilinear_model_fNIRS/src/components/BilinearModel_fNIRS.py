@@ -36,7 +36,13 @@ def fNIRS_Process(Parameters, NoiseSelection):
 
     # Compute the neurodynamics of the system
     Z = Neurodynamics(
-        Z0, timestamps, Parameters["A"], Parameters["B"], Parameters["C"], U_stimulus
+        Z0,
+        timestamps,
+        Parameters["A"],
+        Parameters["B"],
+        Parameters["C"],
+        U_stimulus,
+        freq=Parameters["freq"],
     )
 
     # Process hemodynamics
@@ -81,7 +81,13 @@ def fNIRS_Process(NoiseSelection):
     # Compute the neurodynamics of the system
     print(U_stimulus)
     Z = Neurodynamics(
-        Z0, timestamps, Parameters["A"], Parameters["B"], Parameters["C"], U_stimulus
+        Z0,
+        timestamps,
+        Parameters["A"],
+        Parameters["B"],
+        Parameters["C"],
+        U_stimulus,
+        freq=Parameters["freq"],
     )
 
     # Process hemodynamics
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import numpy as np
+
+# Set the current and root directories to find required files/modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, ".."))
+sys.path.append(root_directory)
+
+from src.components.BilinearModel_StimulusGenerator import (
+    bilinear_model_stimulus_train_generator,
+)
+
+# Hemodynamic parameters of the two regions in Parameters.py
+P_SD = np.array(
+    [[0.0775, -0.0087], [-0.1066, 0.0299], [0.0440, -0.0129], [0.8043, -0.7577]]
+)
+
+
+def make_connectivity():
+    """
+    A, B and C of the two-region model from Parameters.py.
+    """
+    A = np.array([[-0.16, -0.49], [-0.02, -0.33]])
+    B = np.zeros((2, 2, 2))
+    B[:, :, 1] = np.array([[-0.02, -1], [0, -1.31]])
+    C = np.array([[0.08, 0], [0, 0.06]])
+    return A, B, C
+
+
+def make_problem(freq=10):
+    """
+    Two-region model from Parameters.py with a short block design.
+    """
+    A, B, C = make_connectivity()
+    U, timestamps = bilinear_model_stimulus_train_generator(
+        freq, [5, 3], [10, 12], [3, 3], 2
+    )
+    return A, B, C, U, timestamps
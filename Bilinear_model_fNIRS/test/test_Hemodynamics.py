@@ -0,0 +1,239 @@
+import os
+import sys
+
+import numpy as np
+
+# Set the current and root directories to find required files/modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, ".."))
+sys.path.append(root_directory)
+
+from src.components.BilinearModel_Hemodynamics import (
+    Hemodynamics,
+    Hemodynamics_Batch,
+    Hemodynamics_Linear,
+    _euler_kernel_jit,
+    hemodynamic_derivatives,
+    hemodynamic_parameters,
+    hemodynamics_integrator_report,
+)
+from src.components.BilinearModel_HemodynamicKernels import (
+    HemodynamicKernelCache,
+    Hemodynamics_Convolution,
+)
+from src.components.BilinearModel_NeuroHemodynamics import NeuroHemodynamics
+from src.components.BilinearModel_Neurodynamics_v1 import Neurodynamics
+
+from problems import P_SD, make_problem
+
+
+def test_fused_integration_matches_fine_euler():
+    """
+    The coupled neuro-hemodynamic solve agrees with a fine-step Euler run of the
+    two-pass pipeline, and optionally returns Z.
+    """
+    A, B, C, U, timestamps = make_problem()
+    Z0 = np.zeros(2)
+
+    qj, pj, Z = NeuroHemodynamics(
+        Z0, timestamps, A, B, C, U, P_SD, freq=10, return_Z=True
+    )
+
+    substeps = 50
+    fine_timestamps = np.arange(len(timestamps) * substeps) / (10 * substeps)
+    Z_fine = Neurodynamics(Z0, fine_timestamps, A, B, C, U, method="propagator")
+    qj_fine, pj_fine = Hemodynamics(Z_fine.T, P_SD, 1 / (10 * substeps))
+
+    assert qj.shape == pj.shape == (2, len(timestamps))
+    assert np.allclose(Z, Z_fine[::substeps], atol=1e-6)
+    scale = np.max(np.abs(pj_fine - 1))
+    assert np.max(np.abs(pj - pj_fine[:, ::substeps])) < 0.02 * scale
+    assert np.max(np.abs(qj - qj_fine[:, ::substeps])) < 0.02 * scale
+
+
+def reference_euler(Z, P_SD, Step):
+    """
+    Straightforward Euler loop over hemodynamic_derivatives.
+    """
+    rates = hemodynamic_parameters(P_SD, Z.shape[0])
+    return reference_euler_rates(Z, rates, Step)
+
+
+def reference_euler_rates(Z, rates, Step):
+    """
+    Straightforward Euler loop for the given rate constants.
+    """
+    nRegions, simulationLength = Z.shape
+    states = np.ones((5, nRegions, simulationLength))
+    states[0, :, 0] = 0
+    fjout = np.full((nRegions, simulationLength), np.nan)
+    for t in range(1, simulationLength):
+        derivatives = hemodynamic_derivatives(Z[:, t - 1], *states[:, :, t - 1], *rates)
+        Sj, fjin, Vj, qj, pj = states[:, :, t - 1]
+        Sj_dot, fjin_dot, Vj_dot, qj_dot, pj_dot, fjout[:, t], _ = derivatives
+        states[:, :, t] = states[:, :, t - 1] + Step * np.array(
+            [Sj_dot, fjin_dot, Vj_dot, qj_dot, pj_dot]
+        )
+    return states[3], states[4], fjout
+
+
+def test_euler_kernels_match_reference():
+    """
+    The in-place NumPy kernel (and the numba kernel when installed) reproduce the
+    plain Euler loop, with outflow returned only on request.
+    """
+    Z = np.random.default_rng(0).random((2, 400)) * 0.3
+    qj_ref, pj_ref, fjout_ref = reference_euler(Z, P_SD, 1 / 10.84)
+
+    backends = ["numpy"] + (["numba"] if _euler_kernel_jit is not None else [])
+    for backend in backends:
+        assert len(Hemodynamics(Z, P_SD, 1 / 10.84, backend=backend)) == 2
+        qj, pj, fjout, Efp = Hemodynamics(
+            Z, P_SD, 1 / 10.84, return_diagnostics=True, backend=backend
+        )
+        assert np.allclose(qj, qj_ref, rtol=1e-12)
+        assert np.allclose(pj, pj_ref, rtol=1e-12)
+        assert np.allclose(fjout, fjout_ref, rtol=1e-12, equal_nan=True)
+        assert Efp.shape == Z.shape
+
+
+def test_batch_uses_per_region_parameters():
+    """
+    Every ensemble member matches a single-member run with its own per-region
+    rate constants.
+    """
+    rng = np.random.default_rng(1)
+    batch, nRegions = 4, 3
+    Z = rng.random((batch, nRegions, 300)) * 0.3
+    P_SD_batch = rng.normal(0, 0.1, (batch, 4, nRegions))
+
+    qj, pj = Hemodynamics_Batch(Z, P_SD_batch, 1 / 10.84)
+    assert qj.shape == pj.shape == Z.shape
+
+    for b in range(batch):
+        for r in range(nRegions):
+            rates = hemodynamic_parameters(P_SD_batch[b], nRegions, per_region=True)
+            qj_single, pj_single, _ = reference_euler_rates(
+                Z[b, r : r + 1], [rate[r : r + 1] for rate in rates], 1 / 10.84
+            )
+            assert np.allclose(qj[b, r], qj_single[0], rtol=1e-12)
+            assert np.allclose(pj[b, r], pj_single[0], rtol=1e-12)
+
+
+def test_integrator_report_at_coarse_step():
+    """
+    At a 2 Hz step the higher-order integrators stay much closer to the fine
+    reference than forward Euler, and every method returns the usual outputs.
+    """
+    A, B, C, U, timestamps = make_problem(2)
+    Z = Neurodynamics(np.zeros(2), timestamps, A, B, C, U, method="propagator", freq=2)
+
+    report = hemodynamics_integrator_report(Z.T, P_SD, 0.5)
+    assert set(report) == {"euler", "rk4", "expeuler", "adaptive"}
+    for method in ["rk4", "expeuler", "adaptive"]:
+        assert report[method]["max_error"] < report["euler"]["max_error"] / 10
+        qj, pj, state, fjout, Efp = Hemodynamics(
+            Z.T, P_SD, 0.5, method=method, return_state=True, return_diagnostics=True
+        )
+        assert qj.shape == pj.shape == fjout.shape == Z.T.shape
+        assert np.array_equal(state[3], qj[:, -1])
+
+
+def test_linear_fast_path_for_small_signals():
+    """
+    For low-amplitude input the IIR path matches the nonlinear Euler path, and
+    the reported linearization error shrinks quadratically with the amplitude.
+    """
+    A, B, C, U, timestamps = make_problem()
+    Z = Neurodynamics(np.zeros(2), timestamps, A, B, C, U, method="propagator")
+
+    _, _, error = Hemodynamics_Linear(0.1 * Z.T, P_SD, 0.1, return_error=True)
+    qj, pj, small_error = Hemodynamics_Linear(0.01 * Z.T, P_SD, 0.1, return_error=True)
+    qj_nonlinear, pj_nonlinear = Hemodynamics(0.01 * Z.T, P_SD, 0.1)
+
+    assert qj.shape == pj.shape == Z.T.shape
+    assert small_error == np.max(
+        [np.abs(qj - qj_nonlinear).max(), np.abs(pj - pj_nonlinear).max()]
+    )
+    assert small_error < error / 50
+    assert small_error < 1e-2 * np.max(np.abs(pj_nonlinear - 1))
+
+
+def test_convolution_mode_uses_cached_kernels(tmp_path):
+    """
+    The first-order convolution matches the linearized Euler path, the second
+    order term reduces the error on stronger input, and kernels are reused
+    from memory and from disk.
+    """
+    A, B, C, U, timestamps = make_problem()
+    Z = Neurodynamics(np.zeros(2), timestamps, A, B, C, U, method="propagator").T
+    length = Z.shape[1]
+    cache = HemodynamicKernelCache(maxsize=2, cache_dir=str(tmp_path))
+
+    qj, pj = Hemodynamics_Convolution(0.01 * Z, P_SD, 0.1, length, cache=cache)
+    qj_linear, pj_linear = Hemodynamics_Linear(0.01 * Z, P_SD, 0.1)
+    assert np.allclose(qj, qj_linear, atol=1e-8)
+    assert np.allclose(pj, pj_linear, atol=1e-8)
+
+    qj_nonlinear, _ = Hemodynamics(0.1 * Z, P_SD, 0.1)
+    errors = [
+        np.abs(Hemodynamics_Convolution(0.1 * Z, P_SD, 0.1, length, order, cache)[0]
+               - qj_nonlinear).max()
+        for order in (1, 2)
+    ]
+    assert errors[1] < errors[0]
+
+    kernels = cache.get(P_SD, 2, 0.1, length)
+    assert cache.get(P_SD, 2, 0.1, length) is kernels
+    files = sorted(path.name for path in tmp_path.iterdir())
+    assert len(files) == 2 and not any(".tmp" in name for name in files)
+
+    reloaded = HemodynamicKernelCache(cache_dir=str(tmp_path)).get(P_SD, 2, 0.1, length)
+    assert np.array_equal(reloaded["q1"], kernels["q1"])
+
+
+def test_log_state_methods_and_blow_up_detection():
+    """
+    The log-state integrators agree with their linear counterparts at a fine
+    step, and a diverging Euler run stops with FloatingPointError.
+    """
+    A, B, C, U, timestamps = make_problem()
+    Z = Neurodynamics(np.zeros(2), timestamps, A, B, C, U, method="propagator").T
+
+    qj_rk4, pj_rk4 = Hemodynamics(Z, P_SD, 0.1, method="rk4")
+    qj_log, pj_log = Hemodynamics(Z, P_SD, 0.1, method="logrk4")
+    assert np.allclose(qj_log, qj_rk4, atol=1e-6)
+    assert np.allclose(pj_log, pj_rk4, atol=1e-6)
+
+    # Stronger input at a three times coarser step
+    Z_strong = 30 * Z
+    qj_ref, _ = Hemodynamics(Z_strong, P_SD, 0.1, method="rk4", substeps=32)
+    # Hemodynamics uses the resting parameters for region 0 and column 0 of P_SD for the rest
+    P_SD_regions = np.stack([np.zeros(4), P_SD[:, 0]], axis=1)
+    qj_batch, _ = Hemodynamics_Batch(
+        Z_strong[None, :, ::3], P_SD_regions[None], 0.3, method="logrk4"
+    )
+    assert np.all(qj_batch > 0)
+    assert np.abs(qj_batch[0] - qj_ref[:, ::3]).max() < 0.1
+
+    try:
+        Hemodynamics(Z_strong[:, ::10], P_SD, 1.0)
+    except FloatingPointError:
+        pass
+    else:
+        raise AssertionError("Expected FloatingPointError for a diverging run")
+
+
+if __name__ == "__main__":
+    test_fused_integration_matches_fine_euler()
+    test_euler_kernels_match_reference()
+    test_batch_uses_per_region_parameters()
+    test_integrator_report_at_coarse_step()
+    test_linear_fast_path_for_small_signals()
+    test_log_state_methods_and_blow_up_detection()
+    import pathlib
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        test_convolution_mode_uses_cached_kernels(pathlib.Path(directory))
+    print("All tests passed!")
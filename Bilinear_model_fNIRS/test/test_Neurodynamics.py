@@ -0,0 +1,321 @@
+import os
+import sys
+
+import numpy as np
+import scipy.sparse
+from scipy.integrate import odeint
+
+# Set the current and root directories to find required files/modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, ".."))
+sys.path.append(root_directory)
+
+from src.components.BilinearModel_Neurodynamics_v1 import (
+    Neurodynamics,
+    Neurodynamics_Batch,
+    Neurodynamics_Clustered,
+    Neurodynamics_CompiledModel,
+    Neurodynamics_Components,
+    Neurodynamics_Jacobian_terms,
+    Neurodynamics_Model,
+)
+from src.components.BilinearModel_StimulusGenerator import StimulusEvents
+
+from problems import make_problem
+
+
+def reference_solution(Z0, timestamps, A, B, C, U, freq):
+    """
+    Tight-tolerance odeint solution of the same piecewise-linear system.
+    """
+    J0 = Neurodynamics_Jacobian_terms(A)
+
+    def rhs(Z, t):
+        u = U[:, min(int(t * freq), U.shape[1] - 1)]
+        return (J0 + B @ u) @ Z + C @ u
+
+    return odeint(rhs, Z0, timestamps, rtol=1e-11, atol=1e-13, hmax=0.05)
+
+
+def test_propagator_matches_reference():
+    """
+    The propagator engine returns the same (n_timestamps, nRegions) trajectory as
+    a fine odeint reference and leaves A untouched.
+    """
+    A, B, C, U, timestamps = make_problem()
+    A_before = A.copy()
+    Z0 = np.zeros(2)
+
+    Z = Neurodynamics(Z0, timestamps, A, B, C, U, method="propagator", freq=10)
+    Z_ref = reference_solution(Z0, timestamps, A, B, C, U, 10)
+
+    assert Z.shape == (len(timestamps), 2)
+    assert np.allclose(Z, Z_ref, rtol=1e-6, atol=1e-8)
+    assert np.array_equal(A, A_before)
+
+
+def test_batch_matches_individual_runs():
+    """
+    Batched integration returns (batch, n_timestamps, nRegions) and every member
+    matches an individual propagator run.
+    """
+    A, B, C, U, timestamps = make_problem()
+    scales = np.array([0.5, 1.0, 1.5])
+    A_batch = A[None] * scales[:, None, None]
+    B_batch = np.broadcast_to(B, (3,) + B.shape).copy()
+    C_batch = C[None] * scales[:, None, None]
+    Z0 = np.zeros(2)
+
+    Z_lsoda = Neurodynamics_Batch(Z0, timestamps, A_batch, B_batch, C_batch, U)
+    Z_exact = Neurodynamics_Batch(
+        Z0, timestamps, A_batch, B_batch, C_batch, U, method="propagator"
+    )
+
+    assert Z_lsoda.shape == (3, len(timestamps), 2)
+    for b in range(3):
+        Z_single = Neurodynamics(
+            Z0, timestamps, A_batch[b], B, C_batch[b], U, method="propagator"
+        )
+        assert np.allclose(Z_exact[b], Z_single)
+        assert np.allclose(Z_lsoda[b], Z_single, atol=1e-5)
+
+
+def test_compiled_model_is_reproducible_and_non_mutating():
+    """
+    Repeated odeint runs against the same matrices give bit-identical results and
+    leave A, B and C unchanged; the compiled RHS matches Neurodynamics_Model.
+    """
+    A, B, C, U, timestamps = make_problem()
+    originals = [A.copy(), B.copy(), C.copy()]
+    Z0 = np.zeros(2)
+
+    Z_first = Neurodynamics(Z0, timestamps, A, B, C, U)
+    Z_second = Neurodynamics(Z0, timestamps, A, B, C, U)
+
+    assert np.array_equal(Z_first, Z_second)
+    for before, after in zip(originals, [A, B, C]):
+        assert np.array_equal(before, after)
+
+    model = Neurodynamics_CompiledModel(A, B, C, U)
+    Z = np.array([0.3, -0.2])
+    for t in [0.0, 2.5, 7.3]:
+        assert np.allclose(model(Z, t), Neurodynamics_Model(Z, t, A, B, C, U))
+
+
+def test_solver_choice_and_statistics():
+    """
+    Every solver agrees with the reference and reports its evaluation counts.
+    """
+    A, B, C, U, timestamps = make_problem()
+    Z0 = np.zeros(2)
+    Z_ref = reference_solution(Z0, timestamps, A, B, C, U, 10)
+
+    for method in ["LSODA", "BDF", "Radau", "RK45"]:
+        Z, info = Neurodynamics(
+            Z0, timestamps, A, B, C, U, method=method, rtol=1e-8, atol=1e-10,
+            return_info=True,
+        )
+        assert Z.shape == Z_ref.shape
+        assert np.allclose(Z, Z_ref, atol=1e-4)
+        assert info["nfev"] > 0
+        if method in ("BDF", "Radau"):
+            assert info["njev"] > 0
+
+
+def test_jacobian_cache_reuses_input_patterns():
+    """
+    The cached model gives the same trajectory as the uncached one while only
+    building J_t once per distinct stimulus column, and respects its size bound.
+    """
+    A, B, C, U, timestamps = make_problem()
+    Z = np.array([0.3, -0.2])
+
+    cached = Neurodynamics_CompiledModel(A, B, C, U, cache_size=2)
+    uncached = Neurodynamics_CompiledModel(A, B, C, U, cache_size=0)
+    for t in timestamps:
+        assert np.array_equal(cached(Z, t), uncached(Z, t))
+
+    # Two inputs with on/off boxcars give at most four patterns
+    assert len(cached.cache) == 2
+    assert cached.cache.hits > cached.cache.misses
+
+
+def test_breakpoints_follow_stimulus_rate():
+    """
+    With a non-integer stimulus rate every breakpoint strategy reproduces the
+    reference, and restarting at the onsets/offsets reports its step count.
+    """
+    freq = 10.84
+    A, B, C, U, timestamps = make_problem(freq)
+    Z0 = np.zeros(2)
+    Z_ref = reference_solution(Z0, timestamps, A, B, C, U, freq)
+
+    for method in ["LSODA", "BDF"]:
+        for breakpoints in ["tcrit", "restart", None]:
+            Z, info = Neurodynamics(
+                Z0, timestamps, A, B, C, U, method=method, freq=freq,
+                rtol=1e-8, atol=1e-10, breakpoints=breakpoints, return_info=True,
+            )
+            assert np.allclose(Z, Z_ref, atol=1e-5)
+            assert info["nsteps"] > 0
+
+
+def test_sparse_connectivity_matches_dense():
+    """
+    Sparse A/B/C give the same trajectory as their dense equivalents.
+    """
+    rng = np.random.default_rng(0)
+    nRegions = 30
+    A = np.where(rng.random((nRegions, nRegions)) < 0.1, -0.05, 0.0)
+    np.fill_diagonal(A, -0.3)
+    B = np.zeros((nRegions, nRegions, 2))
+    B[:, :, 1] = np.where(rng.random((nRegions, nRegions)) < 0.05, -0.1, 0.0)
+    C = np.zeros((nRegions, 2))
+    C[:5, 0] = 0.08
+    C[5:10, 1] = 0.06
+    _, _, _, U, timestamps = make_problem()
+    Z0 = np.zeros(nRegions)
+
+    A_sparse = scipy.sparse.csr_matrix(A)
+    B_sparse = [scipy.sparse.csr_matrix(B[:, :, i]) for i in range(2)]
+    C_sparse = scipy.sparse.csr_matrix(C)
+
+    for method in ["LSODA", "BDF", "propagator"]:
+        Z_dense = Neurodynamics(Z0, timestamps, A, B, C, U, method=method)
+        Z_sparse = Neurodynamics(
+            Z0, timestamps, A_sparse, B_sparse, C_sparse, U, method=method
+        )
+        assert np.allclose(Z_sparse, Z_dense, atol=1e-6)
+
+    model = Neurodynamics_CompiledModel(A_sparse, B_sparse, C_sparse, U, cache_size=0)
+    dense_model = Neurodynamics_CompiledModel(A, B, C, U)
+    Z = rng.standard_normal(nRegions)
+    assert np.allclose(model(Z, 3.0), dense_model(Z, 3.0))
+
+    # Any sparse matrix switches to the sparse model, whatever format the others have
+    Z_dense = Neurodynamics(Z0, timestamps, A, B, C, U, method="propagator")
+    B_dense_list = [B[:, :, i] for i in range(2)]
+    for A_i, B_i, C_i in [
+        (A, B_sparse, C),
+        (A, B, C_sparse),
+        (A_sparse, B, C),
+        (A, B_dense_list, C),
+    ]:
+        mixed_model = Neurodynamics_CompiledModel(A_i, B_i, C_i, U)
+        assert mixed_model.sparse == (A_i is A_sparse or B_i is B_sparse or C_i is C_sparse)
+        assert np.allclose(mixed_model(Z, 3.0), dense_model(Z, 3.0))
+        for method in ["BDF", "propagator"]:
+            Z_mixed = Neurodynamics(
+                Z0, timestamps, A_i, B_i, C_i, U, method=method, rtol=1e-8, atol=1e-10
+            )
+            assert np.allclose(Z_mixed, Z_dense, atol=1e-6)
+
+    # Nearest-neighbour coupling keeps the LU factors of I - h J_t sparse
+    A_local = scipy.sparse.diags([-0.05, -0.3, -0.05], [-1, 0, 1], shape=(200, 200))
+    B_local = [scipy.sparse.diags([-0.1], [1], shape=(200, 200))] * 2
+    local_model = Neurodynamics_CompiledModel(A_local, B_local, np.zeros((200, 2)), U)
+    assert local_model.factorizes_sparsely()
+    assert not dense_model.factorizes_sparsely()
+
+
+def test_clustered_integration_matches_coupled_system():
+    """
+    Two copies of the two-region model plus an isolated, undriven region form
+    three components; integrating them separately matches the coupled run.
+    """
+    A, B, C, U, timestamps = make_problem()
+    A_full = np.zeros((5, 5))
+    B_full = np.zeros((5, 5, 2))
+    C_full = np.zeros((5, 2))
+    for block in [slice(0, 2), slice(2, 4)]:
+        A_full[block, block] = A
+        B_full[block, block] = B
+        C_full[block] = C
+    A_full[4, 4] = -0.2
+    Z0 = np.zeros(5)
+
+    nComponents, labels = Neurodynamics_Components(A_full, B_full)
+    assert nComponents == 3
+    assert labels[0] == labels[1] != labels[2] == labels[3] != labels[4]
+
+    Z_ref = Neurodynamics(Z0, timestamps, A_full, B_full, C_full, U, method="propagator")
+    for n_jobs in [1, 2]:
+        Z = Neurodynamics_Clustered(
+            Z0, timestamps, A_full, B_full, C_full, U, n_jobs=n_jobs,
+            method="propagator",
+        )
+        assert np.allclose(Z, Z_ref)
+        assert np.all(Z[:, 4] == 0)
+
+    # The default LSODA solver in worker processes, which receive a copy of U
+    Z = Neurodynamics_Clustered(Z0, timestamps, A_full, B_full, C_full, U, n_jobs=2)
+    assert np.allclose(Z, Z_ref, atol=1e-6)
+
+    try:
+        Neurodynamics_Clustered(
+            Z0, timestamps, A_full, B_full, C_full, U, n_jobs=1, return_info=True
+        )
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected ValueError for return_info")
+
+
+def test_event_stimulus_matches_dense_stimulus():
+    """
+    A StimulusEvents design converted from the dense block design gives the
+    same dense matrix back and the same neural response with every method,
+    while a long event-related design stays small until materialized.
+    """
+    A, B, C, U, timestamps = make_problem()
+    events = StimulusEvents.from_dense(U, 10)
+    assert np.array_equal(events.to_dense(10)[0], U)
+    assert np.allclose(events.breakpoints(0, 20), [3, 5, 15, 18, 20])
+
+    for method in ("LSODA", "BDF", "propagator"):
+        Z_dense = Neurodynamics(np.zeros(2), timestamps, A, B, C, U, method=method)
+        Z_events = Neurodynamics(np.zeros(2), timestamps, A, B, C, events, method=method)
+        assert np.allclose(Z_events, Z_dense)
+
+    # Tight tolerances also work with critical times at the exact onsets
+    Z_ref = Neurodynamics(np.zeros(2), timestamps, A, B, C, U, method="propagator")
+    Z_tight = Neurodynamics(
+        np.zeros(2), timestamps, A, B, C, events, rtol=1e-9, atol=1e-12
+    )
+    assert np.allclose(Z_tight, Z_ref, atol=1e-8)
+
+    onsets = np.arange(5000) * 20.0
+    design = StimulusEvents(onsets, 2.0, 1.0, np.arange(5000) % 2, nInputs=2)
+    U_long, _ = design.to_dense(10)
+    assert U_long.shape == (2, 1000000 - 180)
+    assert design.nbytes * 20 < U_long.nbytes
+    assert np.array_equal(design([19.9, 20.0, 41.5]), [[0, 0], [0, 1], [1, 0]])
+
+
+def test_non_float_dense_stimulus():
+    """
+    Integer and float32 dense stimuli, which are copied to float internally,
+    are still looked up as dense columns and match the float64 response.
+    """
+    A, B, C, U, timestamps = make_problem()
+    for method in ("LSODA", "propagator"):
+        Z_ref = Neurodynamics(np.zeros(2), timestamps, A, B, C, U, method=method)
+        for dtype in (int, np.float32):
+            Z = Neurodynamics(
+                np.zeros(2), timestamps, A, B, C, U.astype(dtype), method=method
+            )
+            assert np.allclose(Z, Z_ref)
+
+
+if __name__ == "__main__":
+    test_propagator_matches_reference()
+    test_batch_matches_individual_runs()
+    test_compiled_model_is_reproducible_and_non_mutating()
+    test_solver_choice_and_statistics()
+    test_jacobian_cache_reuses_input_patterns()
+    test_breakpoints_follow_stimulus_rate()
+    test_sparse_connectivity_matches_dense()
+    test_clustered_integration_matches_coupled_system()
+    test_event_stimulus_matches_dense_stimulus()
+    test_non_float_dense_stimulus()
+    print("All tests passed!")
@@ -0,0 +1,155 @@
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+# Set the current and root directories to find required files/modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, ".."))
+sys.path.append(root_directory)
+
+from src.components.BilinearModel_Optics import (
+    F_P,
+    BilinearModel_Optics,
+    OpticalMontage,
+    calculate_hemoglobin_changes,
+    compute_optical_response,
+    inverse_optical_response,
+    optical_response_from_hemodynamics,
+)
+
+
+def make_states(nRegions=3, simulationLength=50, seed=0):
+    """
+    Hemodynamic states close to rest.
+    """
+    rng = np.random.default_rng(seed)
+    pj = 1 + 0.05 * rng.standard_normal((nRegions, simulationLength))
+    qj = 1 + 0.05 * rng.standard_normal((nRegions, simulationLength))
+    return pj, qj
+
+
+def reference_optics(pj, qj):
+    """
+    Per-sample, per-region optics as originally implemented.
+    """
+    nRegions, simulationLength = pj.shape
+    dq = (qj - 1) * 71 * (1 - 0.65)
+    dh = (pj - 1) * 71 - dq
+    Y = np.zeros((2 * nRegions, simulationLength))
+    for t in range(simulationLength):
+        for r in range(nRegions):
+            Y[2 * r : 2 * r + 2, t] = F_P @ np.array([dq[r, t], dh[r, t]])
+    return Y, dq, dh
+
+
+def test_vectorized_optics_match_reference_and_fill_buffers():
+    """
+    All optics entry points reproduce the per-sample loop, write into the
+    supplied buffers and accept leading batch dimensions.
+    """
+    pj, qj = make_states()
+    Y_ref, dq_ref, dh_ref = reference_optics(pj, qj)
+
+    Y, dh, dq = BilinearModel_Optics(pj, qj, np.zeros_like(pj), np.zeros((3, 3)))
+    assert np.allclose(Y, Y_ref, rtol=0, atol=1e-15)
+    assert np.allclose(dq, dq_ref) and np.allclose(dh, dh_ref)
+
+    buffers = (np.empty_like(pj), np.empty_like(pj))
+    dq, dh = calculate_hemoglobin_changes(pj, qj, out=buffers)
+    assert dq is buffers[0] and dh is buffers[1]
+
+    out = np.empty_like(Y_ref)
+    assert compute_optical_response(dq, dh, out=out) is out
+    assert np.allclose(out, Y_ref, rtol=0, atol=1e-15)
+    assert optical_response_from_hemodynamics(pj, qj, out=out) is out
+    assert np.allclose(out, Y_ref, rtol=0, atol=1e-15)
+
+    pj_batch, qj_batch = np.stack([pj, qj]), np.stack([qj, pj])
+    Y_batch = optical_response_from_hemodynamics(pj_batch, qj_batch)
+    assert Y_batch.shape == (2, 6, 50)
+    assert np.allclose(Y_batch[1], reference_optics(qj, pj)[0], rtol=0, atol=1e-15)
+
+    # Long recordings are written block by block, without a Y-sized temporary
+    rng = np.random.default_rng(1)
+    pj_long = 1 + 1e-3 * rng.standard_normal((3, 50000))
+    qj_long = 1 + 1e-3 * rng.standard_normal((3, 50000))
+    out_long = np.empty((6, 50000))
+    tracemalloc.start()
+    optical_response_from_hemodynamics(pj_long, qj_long, out=out_long)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert peak < out_long.nbytes / 4
+    assert np.allclose(out_long, reference_optics(pj_long, qj_long)[0], rtol=0, atol=1e-15)
+
+    try:
+        compute_optical_response(dq, dh, out=np.empty((6, 50))[:, ::2])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected ValueError for a mismatched buffer")
+
+
+def test_montage_projection():
+    """
+    The identity montage reproduces compute_optical_response, and a montage
+    with per-wavelength sensitivities matches the dense per-channel sums.
+    """
+    pj, qj = make_states(nRegions=4)
+    dq, dh = calculate_hemoglobin_changes(pj, qj)
+
+    identity = OpticalMontage.identity(4)
+    assert np.allclose(
+        identity.interleave(identity.project(dq, dh)),
+        compute_optical_response(dq, dh),
+        rtol=0,
+        atol=1e-15,
+    )
+
+    rng = np.random.default_rng(1)
+    sensitivity = [rng.uniform(size=(5, 4)) * (rng.uniform(size=(5, 4)) > 0.5) for _ in range(2)]
+    montage = OpticalMontage(sensitivity)
+    Y = montage.project(dq, dh)
+    for w in range(2):
+        expected = sensitivity[w] @ (F_P[w, 0] * dq + F_P[w, 1] * dh)
+        assert np.allclose(Y[w], expected)
+
+    sources = [[0.0, 0.0], [60.0, 0.0]]
+    detectors = [[20.0, 0.0], [80.0, 0.0], [200.0, 0.0]]
+    regions = [[10.0, 5.0], [70.0, 5.0], [200.0, 5.0]]
+    montage = OpticalMontage.from_positions(sources, detectors, regions)
+    assert montage.channels.tolist() == [[0, 0], [1, 1]]
+    weights = montage.sensitivity[0].toarray()
+    assert weights[0, 0] > 0 and weights[0, 2] == 0 and not weights[:, 2].any()
+
+
+def test_inverse_optics_recovers_concentrations():
+    """
+    The inverse of the per-region optics and of an overdetermined montage
+    recover dq and dh, also in float32, in chunks and for batched Y.
+    """
+    pj, qj = make_states(nRegions=4, simulationLength=101)
+    dq, dh = calculate_hemoglobin_changes(pj, qj)
+
+    Y = compute_optical_response(dq, dh)
+    dq_inv, dh_inv = inverse_optical_response(Y)
+    assert np.allclose(dq_inv, dq) and np.allclose(dh_inv, dh)
+
+    dq_32, dh_32 = inverse_optical_response(np.stack([Y, Y]), dtype=np.float32, chunk_size=16)
+    assert dq_32.dtype == np.float32 and dq_32.shape == (2, 4, 101)
+    assert np.allclose(dh_32[1], dh, rtol=1e-4, atol=1e-5)
+
+    rng = np.random.default_rng(2)
+    montage = OpticalMontage(rng.uniform(size=(6, 4)))
+    Y_channels = montage.project(dq, dh)
+    dq_inv, dh_inv = montage.inverse(Y_channels, chunk_size=30)
+    assert np.allclose(dq_inv, dq) and np.allclose(dh_inv, dh)
+    assert montage.pseudo_inverse() is montage.pseudo_inverse()
+
+
+if __name__ == "__main__":
+    test_vectorized_optics_match_reference_and_fill_buffers()
+    test_montage_projection()
+    test_inverse_optics_recovers_concentrations()
+    print("All tests passed!")
@@ -0,0 +1,112 @@
+import os
+import sys
+
+import numpy as np
+
+# Set the current and root directories to find required files/modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, ".."))
+sys.path.append(root_directory)
+# BilinearModel_SemisyntheticNoise imports through the Bilinear_model_fNIRS package
+sys.path.append(os.path.abspath(os.path.join(root_directory, "..")))
+
+from src.components.BilinearModel_SemisyntheticNoise import (
+    SemisyntheticNoiseBank,
+    add_noise_to_hemodynamics,
+    load_noise_recording,
+    resample_noise,
+    resampling_plan,
+    semisynthecticDataExtraction,
+)
+
+
+def test_noise_recordings_use_binary_cache(tmp_path):
+    """
+    A recording is parsed once into a memory-mapped .npy file, reused within
+    the process, and parsed again after the text file changes.
+    """
+    recording = tmp_path / "oxyhb_test.txt"
+    data = np.arange(12.0).reshape(4, 3)
+    np.savetxt(recording, data)
+    cache_directory = str(tmp_path / "cache")
+
+    loaded = load_noise_recording(str(recording), cache_directory)
+    assert isinstance(loaded, np.memmap)
+    assert np.array_equal(loaded, data)
+    assert load_noise_recording(str(recording), cache_directory) is loaded
+    assert len(os.listdir(cache_directory)) == 1
+
+    np.savetxt(recording, 2 * data)
+    os.utime(recording, ns=(0, os.stat(recording).st_mtime_ns + 10**9))
+    reloaded = load_noise_recording(str(recording), cache_directory)
+    assert np.array_equal(reloaded, 2 * data)
+    assert len(os.listdir(cache_directory)) == 2
+
+    noises = semisynthecticDataExtraction(3, 10, 100)
+    assert len(noises) == 3
+    assert noises[0][0].shape == noises[0][1].shape == (100,)
+
+
+def test_noise_bank_draws_paired_channels(tmp_path):
+    """
+    The bank indexes every recording pair, draws reproducible distinct
+    channels per realization and keeps oxy and deoxy of the same channel.
+    """
+    for name, length in (("1", 6), ("2", 5)):
+        deoxy = np.arange(length * 3.0).reshape(length, 3) + 100 * int(name)
+        np.savetxt(tmp_path / f"deoxyhb_{name}.txt", deoxy)
+        np.savetxt(tmp_path / f"oxyhb_{name}.txt", -deoxy)
+    bank = SemisyntheticNoiseBank(str(tmp_path), str(tmp_path / "cache"))
+    assert bank.names == ["1", "2"] and len(bank) == 6 and bank.length == 5
+
+    channels = bank.draw(4, realizations=10, seed=3)
+    assert channels.shape == (10, 4)
+    assert np.array_equal(channels, bank.draw(4, realizations=10, seed=3))
+    assert all(len(set(row)) == 4 for row in channels)
+
+    noise = bank.take(channels)
+    assert noise.shape == (2, 10, 4, 5)
+    assert np.array_equal(noise[1], -noise[0])
+
+    deoxy, oxy = bank.pair(channels[2, 1])
+    assert np.array_equal(deoxy, noise[0, 2, 1]) and np.array_equal(oxy, noise[1, 2, 1])
+    assert np.shares_memory(deoxy, bank.recordings[bank.recording_index[channels[2, 1]]][0])
+
+
+def test_polyphase_noise_resampling():
+    """
+    Noise is converted between sampling rates in one cached polyphase pass
+    along the time axis, and add_noise_to_hemodynamics accepts it unchanged.
+    """
+    plan = resampling_plan(4, 10.84, 500)
+    assert plan is resampling_plan(4, 10.84, 500)
+    assert plan[:2] == (271, 100)
+
+    time_4hz = np.arange(800) / 4
+    slow = np.sin(2 * np.pi * 0.1 * time_4hz)
+    noise = np.stack([[slow, 2 * slow], [-slow, slow]])
+    resampled = resample_noise(noise, 4, 10, 1500)
+    assert resampled.shape == (2, 2, 1500)
+    expected = np.sin(2 * np.pi * 0.1 * np.arange(1500) / 10)
+    assert np.abs(resampled[0, 1, 100:-100] - 2 * expected[100:-100]).max() < 1e-2
+
+    # Inputs shorter than needed are repeated
+    assert resample_noise(slow[:100], 4, 10, 1000).shape == (1000,)
+
+    deltaQ = np.zeros((2, 1500))
+    deltaH = np.zeros((2, 1500))
+    pairs = [(resampled[0, i], resampled[1, i]) for i in range(2)]
+    deltaQ, deltaH = add_noise_to_hemodynamics(deltaQ, deltaH, pairs, 5, np.arange(1500))
+    assert deltaQ.shape == deltaH.shape == (2, 1500)
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        test_noise_recordings_use_binary_cache(pathlib.Path(directory))
+    with tempfile.TemporaryDirectory() as directory:
+        test_noise_bank_draws_paired_channels(pathlib.Path(directory))
+    test_polyphase_noise_resampling()
+    print("All tests passed!")
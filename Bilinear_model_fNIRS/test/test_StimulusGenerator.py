@@ -10,6 +10,8 @@ sys.path.append(root_directory)
 
 # Import the bilinear_model_stimulus_train_generator function from its module
 from src.components.BilinearModel_StimulusGenerator import (
+    StimulusEvents,
+    bilinear_model_event_related_design,
     bilinear_model_stimulus_train_generator,
 )
 
@@ -73,6 +75,43 @@ def test_bilinear_model_stimulus_train_generator():
     print("All tests passed!")
 
 
+def test_event_related_design():
+    """
+    Test the randomized event-related design generator.
+
+    Tests cover:
+    - Reproducibility from the seed and output shapes
+    - Inter-stimulus intervals within the requested range
+    - Agreement between the event table and the dense stimulus matrix
+    """
+    options = dict(
+        isi_range=(3, 6), durations=[1, 2], amplitudes=[1, 0.5], realizations=4, seed=7
+    )
+    U, timestamps = bilinear_model_event_related_design(10, 30, 3, **options)
+    U_again, _ = bilinear_model_event_related_design(10, 30, 3, **options)
+    events = bilinear_model_event_related_design(10, 30, 3, output="events", **options)
+
+    assert np.array_equal(U, U_again)
+    assert U.shape == (4, 3, len(timestamps))
+    assert len(events) == 4 * 3 * 30
+    assert set(np.unique(U)) <= {0, 0.5, 1}
+
+    for realization in range(4):
+        rows = events[events["realization"] == realization]
+        for region in range(3):
+            trials = rows[rows["input"] == region]
+            isi = np.diff(trials["onset"]) - trials["duration"][:-1]
+            assert np.all((isi >= 3 - 1e-9) & (isi <= 6 + 1e-9))
+        design = StimulusEvents(
+            rows["onset"], rows["duration"], rows["amplitude"], rows["input"], nInputs=3
+        )
+        assert np.array_equal(design.to_dense(10, len(timestamps))[0], U[realization])
+
+    U_single, _ = bilinear_model_event_related_design(10, 5, 2, seed=0)
+    assert U_single.ndim == 2
+
+
 if __name__ == "__main__":
     # Run the test function when the script is executed
     test_bilinear_model_stimulus_train_generator()
+    test_event_related_design()
@@ -0,0 +1,123 @@
+import os
+import sys
+
+import numpy as np
+
+# Set the current and root directories to find required files/modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, ".."))
+sys.path.append(root_directory)
+
+from src.components.BilinearModel_Hemodynamics import Hemodynamics
+from src.components.BilinearModel_Neurodynamics_v1 import Neurodynamics
+from src.components.BilinearModel_StimulusGenerator import (
+    StimulusEvents,
+    bilinear_model_stimulus_train_generator,
+)
+from src.components.BilinearModel_Streaming import (
+    fNIRS_Process_Stream,
+    load_stream_checkpoint,
+    save_stream_checkpoint,
+)
+
+from problems import P_SD, make_connectivity
+
+
+def make_parameters():
+    """
+    Two-region parameters from Parameters.py.
+    """
+    A, B, C = make_connectivity()
+    freq = 10.84
+    return {"A": A, "B": B, "C": C, "P_SD": P_SD, "freq": freq, "step": 1 / freq}
+
+
+def test_stream_matches_full_session_and_resumes(tmp_path):
+    """
+    Concatenated chunks reproduce the whole-session pipeline, and resuming from a
+    saved checkpoint yields the same remaining chunks.
+    """
+    Parameters = make_parameters()
+    U, timestamps = bilinear_model_stimulus_train_generator(
+        Parameters["freq"], [5, 3], [10, 12], [3, 3], 2
+    )
+
+    Z = Neurodynamics(
+        np.zeros(2), timestamps, Parameters["A"], Parameters["B"], Parameters["C"],
+        U, method="propagator", freq=Parameters["freq"],
+    )
+    qj, pj = Hemodynamics(Z.T, Parameters["P_SD"], Parameters["step"])
+
+    chunks = list(fNIRS_Process_Stream(Parameters, U, chunk_size=97, method="propagator"))
+    assert np.allclose(np.concatenate([c["Z"] for c in chunks]), Z)
+    assert np.allclose(np.hstack([c["qj"] for c in chunks]), qj)
+    assert np.allclose(np.hstack([c["pj"] for c in chunks]), pj)
+    assert np.allclose(np.concatenate([c["timestamps"] for c in chunks]), timestamps)
+    assert chunks[-1]["Y"].shape == (4, chunks[-1]["qj"].shape[1])
+
+    # The default LSODA solver only sees the stimulus window of each chunk
+    Z_lsoda = np.concatenate(
+        [c["Z"] for c in fNIRS_Process_Stream(Parameters, U, chunk_size=97)]
+    )
+    assert np.allclose(Z_lsoda, Z, atol=1e-6)
+
+    checkpoint_file = tmp_path / "checkpoint.npz"
+    save_stream_checkpoint(checkpoint_file, chunks[2]["state"])
+    resumed = list(
+        fNIRS_Process_Stream(
+            Parameters, U, chunk_size=97,
+            state=load_stream_checkpoint(checkpoint_file), method="propagator",
+        )
+    )
+    assert len(resumed) == len(chunks) - 3
+    for original, repeated in zip(chunks[3:], resumed):
+        assert np.array_equal(original["Y"], repeated["Y"])
+
+
+def test_stream_reads_stimulus_on_demand():
+    """
+    A StimulusEvents design and an iterable of uneven stimulus chunks stream the
+    same session as the dense matrix, including a resume from a checkpoint.
+    """
+    Parameters = make_parameters()
+    U, timestamps = bilinear_model_stimulus_train_generator(
+        Parameters["freq"], [5, 3], [10, 12], [3, 3], 2
+    )
+    options = {"chunk_size": 97, "method": "propagator"}
+    dense = list(fNIRS_Process_Stream(Parameters, U, **options))
+
+    events = StimulusEvents.from_dense(U, Parameters["freq"])
+    from_events = list(
+        fNIRS_Process_Stream(Parameters, events, nSamples=U.shape[1], **options)
+    )
+
+    def stimulus_chunks():
+        for start in range(0, U.shape[1], 61):
+            yield U[:, start : start + 61]
+
+    from_chunks = list(fNIRS_Process_Stream(Parameters, stimulus_chunks(), **options))
+    resumed = list(
+        fNIRS_Process_Stream(
+            Parameters, stimulus_chunks(), state=dense[2]["state"], **options
+        )
+    )
+
+    assert len(from_events) == len(from_chunks) == len(dense)
+    for expected, streamed in zip(dense, from_events):
+        assert np.allclose(streamed["Y"], expected["Y"])
+    for expected, streamed in zip(dense, from_chunks):
+        assert np.array_equal(streamed["Y"], expected["Y"])
+    assert len(resumed) == len(dense) - 3
+    for expected, streamed in zip(dense[3:], resumed):
+        assert np.array_equal(streamed["Y"], expected["Y"])
+        assert np.array_equal(streamed["timestamps"], expected["timestamps"])
+
+
+if __name__ == "__main__":
+    import pathlib
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as directory:
+        test_stream_matches_full_session_and_resumes(pathlib.Path(directory))
+    test_stream_reads_stimulus_on_demand()
+    print("All tests passed!")
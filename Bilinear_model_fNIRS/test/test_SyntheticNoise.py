@@ -0,0 +1,64 @@
+import os
+import sys
+
+import numpy as np
+
+# Set the current and root directories to find required files/modules
+current_directory = os.path.dirname(os.path.abspath(__file__))
+root_directory = os.path.abspath(os.path.join(current_directory, ".."))
+sys.path.append(root_directory)
+# BilinearModel_SyntheticNoise imports through the Bilinear_model_fNIRS package
+sys.path.append(os.path.abspath(os.path.join(root_directory, "..")))
+
+from src.components.BilinearModel_SyntheticNoise import (
+    batched_pink_noise,
+    generate_harmonic_noise,
+    generate_physiological_noise_bank,
+    synthetic_physiological_noise_bank,
+)
+
+
+def test_physiological_noise_bank():
+    """
+    The noise bank is reproducible, independent across regions and
+    realizations, keeps the harmonic structure of generate_harmonic_noise and
+    scales every trace to the requested combined amplitude.
+    """
+    timestamps = np.arange(600) / 10
+    noise_types = ["heart", "breathing", "vasomotion", "white"]
+    hemodynamics = np.full((2, 600), 2.0)
+
+    noises = synthetic_physiological_noise_bank(
+        timestamps, noise_types, 3, realizations=4, HemodynamicSample=hemodynamics,
+        percent_error=10, seed=5,
+    )
+    again = synthetic_physiological_noise_bank(
+        timestamps, noise_types, 3, realizations=4, HemodynamicSample=hemodynamics,
+        percent_error=10, seed=5,
+    )
+    assert noises.shape == (4, 4, 3, 600)
+    assert np.array_equal(noises, again)
+    assert not np.allclose(noises[0, 0, 0], noises[0, 0, 1])
+    assert not np.allclose(noises[0, 0, 0], noises[0, 1, 0])
+    assert np.allclose(np.abs(noises).max(axis=-1).sum(axis=0), 0.2)
+
+    single = synthetic_physiological_noise_bank(timestamps, ["heart"], 2, seed=0)
+    assert single.shape == (1, 2, 600)
+
+    # Fundamental and harmonics of one trace, without the pink component
+    seed = np.random.default_rng(1)
+    noise = generate_physiological_noise_bank(timestamps, "breathing", (2,), seed)
+    replay = np.random.default_rng(1)
+    base_freq = np.abs(replay.normal(0.22, 0.07, size=(2,)))
+    pink = batched_pink_noise((2,), 600, replay)
+    primary = np.sin(2 * np.pi * base_freq[:, None] * timestamps)
+    pink *= primary.std(axis=-1, keepdims=True) / pink.std(axis=-1, keepdims=True)
+    expected = np.sin(2 * np.pi * base_freq[1] * timestamps) + generate_harmonic_noise(
+        base_freq[1], timestamps
+    )
+    assert np.allclose(noise[1] - pink[1], expected)
+
+
+if __name__ == "__main__":
+    test_physiological_noise_bank()
+    print("All tests passed!")